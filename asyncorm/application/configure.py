@@ -4,13 +4,19 @@ import importlib
 import inspect
 import os
 
+from ..database.instrumentation import instrumentation
+from ..database.slow_queries import SlowQueryLog
+from ..database.transactions import gather
 from ..exceptions import ConfigError, ModuleError, ModelError
 
 DEFAULT_CONFIG = {
+    'concurrency': 10,
     'db_config': None,
     'loop': asyncio.get_event_loop(),
     'manager': 'PostgresManager',
     'modules': None,
+    'query_stats': False,
+    'slow_queries': None,
 }
 
 
@@ -19,6 +25,7 @@ class OrmApp(object):
     loop = None
     models = {}
     modules = {}
+    slow_queries = None
 
     def configure(self, config):
         '''
@@ -50,6 +57,17 @@ class OrmApp(object):
         manager = getattr(database_module, DEFAULT_CONFIG['manager'])
         self.db_manager = manager(db_config)
 
+        # the statistics by query shape are opt in
+        instrumentation.collect_stats = DEFAULT_CONFIG['query_stats']
+
+        # the slow queries are logged when there is a threshold configured
+        if self.slow_queries is not None:
+            self.slow_queries.uninstall(instrumentation)
+            self.slow_queries = None
+        if DEFAULT_CONFIG['slow_queries']:
+            self.slow_queries = SlowQueryLog(**DEFAULT_CONFIG['slow_queries'])
+            self.slow_queries.install(instrumentation)
+
         # we have to manually add the migrations table
         modules.append('asyncorm.models.migrations')
 
@@ -57,6 +75,23 @@ class OrmApp(object):
         self.get_declared_models(modules)
         self.models_configure()
 
+    def transaction(self):
+        '''
+        async context manager that runs all the queries of the block in
+        one transaction, on a connection pinned for the block
+        '''
+        return self.db_manager.transaction()
+
+    async def gather(self, *awaitables, concurrency=None):
+        '''
+        awaits the querysets and coroutines concurrently, each one on its
+        own pooled connection, at most concurrency of them at once.
+        The results are returned in the same order
+        '''
+        return await gather(
+            awaitables, concurrency or DEFAULT_CONFIG['concurrency']
+        )
+
     def get_declared_models(self, modules):
         if len(modules) == 1:
             self.models = {}
@@ -139,6 +174,9 @@ class OrmApp(object):
         for model in self.models.values():
             await model().objects.unique_together()
 
+        for model in self.models.values():
+            await model().objects.create_indexes()
+
     def sync_db(self):
         self.loop.run_until_complete(
             asyncio.gather(self.loop.create_task(self.create_db()))
@@ -175,8 +213,49 @@ def parse_config(config_file):
             'host': parsed_file.get('db_config', 'host') or None,
             'user': parsed_file.get('db_config', 'user') or None,
             'password': parsed_file.get('db_config', 'password') or None,
+            # optional read replicas, as whitespace separated dsns
+            'replicas': parsed_file.get(
+                'db_config', 'replicas', fallback=''
+            ).split(),
+            'router': parsed_file.get('db_config', 'router', fallback=None),
+            # default statement timeout, in seconds
+            'timeout': parsed_file.getfloat(
+                'db_config', 'timeout', fallback=None
+            ),
+            # module that encodes and decodes the jsonb values
+            'json_module': parsed_file.get(
+                'db_config', 'json_module', fallback=None
+            ),
+            # optional extra shards, as whitespace separated dsns
+            'shards': parsed_file.get(
+                'db_config', 'shards', fallback=''
+            ).split(),
         },
-        'modules': parsed_file.get('orm', 'modules').split() or []
+        'modules': parsed_file.get('orm', 'modules').split() or [],
+        'concurrency': parsed_file.getint(
+            'orm', 'concurrency', fallback=DEFAULT_CONFIG['concurrency']
+        ),
+        'query_stats': parsed_file.getboolean(
+            'orm', 'query_stats', fallback=False
+        ),
+        'slow_queries': parse_slow_queries(parsed_file),
+    }
+
+
+def parse_slow_queries(parsed_file):
+    # the slow query log is only set when it has a threshold (in seconds)
+    threshold = parsed_file.getfloat(
+        'orm', 'slow_query_threshold', fallback=None
+    )
+    if threshold is None:
+        return None
+    return {
+        'threshold': threshold,
+        'size': parsed_file.getint('orm', 'slow_query_log_size', fallback=100),
+        'explain': parsed_file.getint('orm', 'slow_query_explain', fallback=0),
+        'redact': parsed_file.getboolean(
+            'orm', 'slow_query_redact', fallback=True
+        ),
     }
 
 
@@ -1,3 +1,14 @@
 from .db_manager import PostgresManager, Cursor
+from .fake import FakeManager, generate_records
+from .instrumentation import QueryEvent, QueryStats, instrumentation
+from .nplusone import NPlusOneDetector
+from .slow_queries import SlowQueryLog
+from .routers import RoundRobinRouter, LeastBusyRouter, shard_by_hash
+from .transactions import Transaction
 
-__all__ = ['PostgresManager', 'Cursor']
+__all__ = [
+    'PostgresManager', 'Cursor', 'RoundRobinRouter', 'LeastBusyRouter',
+    'shard_by_hash', 'Transaction', 'QueryEvent', 'QueryStats',
+    'instrumentation', 'SlowQueryLog', 'NPlusOneDetector', 'FakeManager',
+    'generate_records',
+]
@@ -1,32 +1,116 @@
+import asyncio
+import importlib
+from collections import deque
+from functools import partial
+from time import perf_counter
+
+from ..exceptions import ConfigError, QueryTimeoutError
 from ..log import logger
+from .instrumentation import QueryEvent, instrumentation
+from .routers import ROUTERS, shard_by_hash
+from .transactions import Transaction, current_transaction
+
+
+def timed_out(exc):
+    '''
+    the query ran out of time: the asyncpg timeout expired (asyncpg
+    cancels the statement on the server too) or the server statement
+    timeout did, not cancelled for any other reason
+    '''
+    import asyncpg
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    return isinstance(exc, asyncpg.exceptions.QueryCanceledError) and (
+        'statement timeout' in str(exc)
+    )
+
+
+def timeout_error(timeout, query):
+    return QueryTimeoutError(
+        'The query exceeded the {} seconds timeout: {}'.format(timeout, query)
+    )
 
 
 class Cursor(object):
 
-    def __init__(self, conn, query, step=20, forward=0, stop=None):
+    def __init__(self, conn, query, step=20, timeout=None, details=None,
+                 manager=None):
         self._conn = conn
         self._query = query
+        self._details = details or {}
+        # the manager of the connection, its fetches count as busy
+        self._manager = manager
         self._cursor = None
-        self._results = []
+        self._results = deque()
 
         self._step = step
-        self._forward = forward
-        self._stop = stop
+        # the rows already fetched, skipped when the cursor is opened again
+        self._forward = 0
+        self._timeout = timeout
 
     async def get_results(self):
+        return deque(await self.measured(self.fetch_results))
+
+    async def measured(self, fetch):
+        '''awaits the fetch coroutine function as an instrumented query'''
+        event = QueryEvent(self._query, **self._details)
+        event.manager = self._manager
+        instrumentation.before(event)
+
+        if self._manager is not None:
+            self._manager.busy += 1
+        start = perf_counter()
+        try:
+            results = await fetch()
+            event.rows = len(results)
+        except StopAsyncIteration:
+            event.rows = 0
+            raise
+        except Exception as exc:
+            if timed_out(exc):
+                event.error = timeout_error(self._timeout, self._query)
+                raise event.error
+            event.error = exc
+            raise
+        finally:
+            if self._manager is not None:
+                self._manager.busy -= 1
+            event.execution_time = perf_counter() - start
+            instrumentation.after(event)
+        return results
+
+    async def chunks(self):
+        '''
+        the records in lists of step, all from the same server side cursor
+        kept open in its transaction until the last one is fetched
+        '''
         async with self._conn.transaction():
-            self._cursor = await self._conn.cursor(self._query)
+            cursor = await self._conn.cursor(
+                self._query, timeout=self._timeout
+            )
 
-            if self._forward:
-                await self._cursor.forward(self._forward)
+            while True:
+                results = await self.measured(
+                    partial(cursor.fetch, self._step, timeout=self._timeout)
+                )
+                if not results:
+                    break
+                yield results
 
-            no_stop = self._stop is not None
-            if no_stop and self._forward >= self._stop:
-                raise StopAsyncIteration()
-            if no_stop and self._forward + self._step >= self._stop:
-                self._step = self._stop - self._forward
+    async def fetch_results(self):
+        async with self._conn.transaction():
+            self._cursor = await self._conn.cursor(
+                self._query, timeout=self._timeout
+            )
 
-            results = await self._cursor.fetch(self._step)
+            if self._forward:
+                await self._cursor.forward(
+                    self._forward, timeout=self._timeout
+                )
+
+            results = await self._cursor.fetch(
+                self._step, timeout=self._timeout
+            )
 
             if not results:
                 raise StopAsyncIteration()
@@ -41,18 +125,90 @@ class Cursor(object):
 
         if not self._results:
             self._forward = self._forward + self._step
-            if self._stop is not None and self._forward > self._stop:
-                self._forward = self._stop
             self._results = await self.get_results()
 
-        return self._results.pop(0)
+        return self._results.popleft()
 
 
 class GeneralManager(object):
 
     def __init__(self, conn_data):
+        conn_data = dict(conn_data)
+        replicas = conn_data.pop('replicas', None) or []
+        router = conn_data.pop('router', None) or 'round_robin'
+        shards = conn_data.pop('shards', None) or []
+        shard_function = conn_data.pop('shard_function', None)
+        # default statement timeout, in seconds
+        self.timeout = conn_data.pop('timeout', None)
+        # module (json by default) with the dumps and loads of the jsonb
+        # codecs, any with the same interface can be plugged in
+        json_module = conn_data.pop('json_module', None) or 'json'
+        if isinstance(json_module, str):
+            json_module = importlib.import_module(json_module)
+        self.json_module = json_module
+
         self.conn_data = conn_data
         self.conn = None
+        self.pool = None
+        self.busy = 0
+
+        # the replicas are managers on their own, only used to read
+        self.replicas = [
+            self.__class__(self.replica_data(r)) for r in replicas
+        ]
+        if callable(router):
+            self.router = router
+        elif router in ROUTERS:
+            self.router = ROUTERS[router]()
+        else:
+            raise ConfigError('{} is not a known router'.format(router))
+
+        # this database is the first shard, the rest are added to it
+        self.shards = shards and [self] + [
+            self.__class__(self.replica_data(s)) for s in shards
+        ] or []
+        self.shard_function = shard_function or shard_by_hash
+
+    def replica_data(self, replica):
+        # replicas (and shards) defined by dsn or by the connection data
+        # that differs from the primary database
+        if isinstance(replica, str):
+            return {
+                'dsn': replica,
+                'loop': self.conn_data.get('loop'),
+                'timeout': self.timeout,
+                'json_module': self.json_module,
+            }
+        conn_data = dict(
+            self.conn_data, timeout=self.timeout, json_module=self.json_module
+        )
+        conn_data.update(replica)
+        return conn_data
+
+    def json_encode(self, value):
+        encoded = self.json_module.dumps(value)
+        # some fast encoders return bytes instead of str
+        if isinstance(encoded, bytes):
+            return encoded.decode()
+        return encoded
+
+    def route(self, read=False, using=None):
+        '''the manager that should attend the request'''
+        if using == 'primary' or not read or not self.replicas:
+            return self
+        # the replicas can not see what the transaction wrote
+        transaction = current_transaction.get()
+        if transaction is not None and transaction.atomic:
+            return self
+        return self.router(self.replicas)
+
+    def transaction(self):
+        '''async context manager, nested ones are savepoints'''
+        return Transaction()
+
+    def shard_for(self, value):
+        '''the manager of the shard that holds that shard key value'''
+        return self.shards[self.shard_function(value, len(self.shards))]
 
     @property
     def db__create_table(self):
@@ -95,7 +251,10 @@ class GeneralManager(object):
 
     @property
     def db__select_all(self):
-        return 'SELECT {select} FROM {table_name} {join} {ordering}'
+        return (
+            'SELECT {select} FROM {table_name} {join} {group_by} '
+            '{ordering} {limit}'
+        )
 
     @property
     def db__select_related(self):
@@ -108,14 +267,51 @@ class GeneralManager(object):
     @property
     def db__select(self):
         return self.db__select_all.replace(
-            '{ordering}',
-            'WHERE ( {condition} ) {ordering}'
+            '{group_by}',
+            'WHERE ( {condition} ) {group_by}'
         )
 
     @property
     def db__exists(self):
         return 'SELECT EXISTS({})'.format(self.db__select)
 
+    @property
+    def db__count_grouped(self):
+        # the groups of the query, not the rows grouped
+        return 'SELECT COUNT(*) FROM ({query}) AS grouped;'
+
+    @property
+    def db__count_estimate(self):
+        return '''
+            SELECT reltuples::bigint FROM pg_class
+            WHERE oid = '{table_name}'::regclass;
+        '''
+
+    @property
+    def db__explain(self):
+        return 'EXPLAIN ({options}) {query}'
+
+    @property
+    def db__select_json(self):
+        # the rows of the query as a json array, built by the database
+        return (
+            "SELECT coalesce(json_agg({json_object}), '[]')::text "
+            'FROM ({query}) AS {table_name}'
+        )
+
+    @property
+    def db__select_json_related(self):
+        return (
+            '(SELECT {json_object} FROM {right_table} '
+            'WHERE {right_table}.{model_db_pk} = {foreign_field})'
+        )
+
+    @property
+    def db__create_index(self):
+        return '''
+            CREATE INDEX IF NOT EXISTS {index_name}
+            ON {table_name} USING {index_method} ({db_column}) '''
+
     @property
     def db__where(self):
         '''chainable'''
@@ -127,7 +323,7 @@ class GeneralManager(object):
             SELECT {select} FROM {other_tablename}
             WHERE {otherdb_pk} = ANY (
                 SELECT {other_tablename} FROM {m2m_tablename} WHERE {id_data}
-            )
+            ) {ordering} {limit}
         '''
 
     @property
@@ -150,22 +346,84 @@ class GeneralManager(object):
         return query
 
     @staticmethod
-    def ordering_syntax(ordering):
+    def ordering_syntax(ordering, aliases=()):
         result = []
         if not ordering:
             return ''
         for f in ordering:
+            column = f.lstrip('-')
+            if column in aliases:
+                # quoted, as the select names them
+                column = '"{}"'.format(column)
             if f.startswith('-'):
-                result.append(' {} DESC '.format(f[1:]))
+                result.append(' {} DESC '.format(column))
             else:
-                result.append(f)
+                result.append(column)
         result = 'ORDER BY {}'.format(','.join(result))
         return result
 
+    @staticmethod
+    def sort_records(records, ordering):
+        '''sorts the records merged from different databases'''
+        for f in reversed(ordering or []):
+            column = f.lstrip('-')
+            # nulls go last, or first when descending, as in postgres
+            records.sort(
+                key=lambda r: (r[column] is None, r[column]),
+                reverse=f.startswith('-'),
+            )
+        return records
+
+    @staticmethod
+    def group_by_syntax(columns):
+        if not columns:
+            return ''
+        return 'GROUP BY {}'.format(', '.join(c['sql'] for c in columns))
+
+    @staticmethod
+    def keyset_syntax(ordering, values):
+        '''condition for the rows that come after values in that ordering'''
+        columns = [f.lstrip('-') for f in ordering]
+        descending = [f.startswith('-') for f in ordering]
+
+        # when all the columns are sorted the same way a row comparison
+        # is enough, and it can be resolved using a multicolumn index
+        if len(set(descending)) == 1:
+            return '({}) {} ({})'.format(
+                ','.join(columns),
+                descending[0] and '<' or '>',
+                ','.join(values),
+            )
+
+        result = []
+        for i, column in enumerate(columns):
+            condition = [
+                '{} = {}'.format(c, v)
+                for c, v in zip(columns[:i], values[:i])
+            ]
+            condition.append('{} {} {}'.format(
+                column, descending[i] and '<' or '>', values[i]
+            ))
+            result.append('({})'.format(' AND '.join(condition)))
+        return '({})'.format(' OR '.join(result))
+
+    @staticmethod
+    def limit_syntax(limit, offset=None):
+        result = []
+        if limit is not None:
+            result.append('LIMIT {}'.format(limit))
+        if offset:
+            result.append('OFFSET {}'.format(offset))
+        return ' '.join(result)
+
     def construct_query(self, query_chain):
         # here we take the query_chain and convert to a real sql sentence
         res_dict = query_chain.pop(0)
 
+        # if we are not calculating, then we can asign ordering
+        operations = ['COUNT', 'MAX', 'MIN', 'SUM', 'AVG', 'STDDEV']
+        calculation = res_dict.get('select', '').split('(')[0] in operations
+
         for q in query_chain:
             if q['action'] == 'db__where':
                 if res_dict['action'] == 'db__select_all':
@@ -186,7 +444,7 @@ class GeneralManager(object):
 
                     select = res_dict['select'][:]
 
-                    if select == 'COUNT(*)':
+                    if calculation:
                         pass
                     elif select == '*':
                         select = select.replace(
@@ -202,33 +460,125 @@ class GeneralManager(object):
                             model_join['fields_formatter']
                         )
 
-        # if we are not counting, then we can asign ordering
-        operations = ['COUNT', 'MAX', 'MIN', 'SUM', 'AVG', 'STDDEV']
-        if res_dict.get('select', '').split('(')[0] not in operations:
+        # values querysets select only those columns, grouped by them
+        # when there are aggregations to annotate
+        res_dict['group_by'] = ''
+        if res_dict.get('values') and not calculation:
+            annotations = res_dict.get('annotations', [])
+            res_dict['select'] = ', '.join([
+                '{sql} AS "{name}"'.format(**c)
+                for c in res_dict['values'] + annotations
+            ])
+            if annotations:
+                res_dict['group_by'] = self.group_by_syntax(
+                    res_dict['values']
+                )
+
+        if not calculation:
             res_dict['ordering'] = self.ordering_syntax(
-                res_dict.get('ordering', [])
+                res_dict.get('ordering', []), [
+                    c['name'] for c in
+                    (res_dict.get('values') or []) +
+                    res_dict.get('annotations', [])
+                ]
+            )
+            res_dict['limit'] = self.limit_syntax(
+                res_dict.get('limit'), res_dict.get('offset')
             )
         else:
             res_dict['ordering'] = ''
+            res_dict['limit'] = ''
 
         query = getattr(self, res_dict['action']).format(**res_dict)
         query = self.query_clean(query)
 
-        logger.debug('QUERY: {}'.format(query))
+        logger.debug('QUERY: %s', query)
         return query
 
 
 class PostgresManager(GeneralManager):
 
-    async def get_conn(self):
+    async def get_pool(self):
         import asyncpg
+        if not self.pool:
+            self.pool = await asyncpg.create_pool(
+                init=self.init_connection, **self.conn_data
+            )
+        return self.pool
+
+    async def init_connection(self, conn):
+        # the jsonb values are sent and received as python objects
+        await conn.set_type_codec(
+            'jsonb',
+            encoder=self.json_encode,
+            decoder=self.json_module.loads,
+            schema='pg_catalog',
+        )
+
+    async def acquire(self):
+        pool = await self.get_pool()
+        return await pool.acquire()
+
+    async def release(self, conn):
+        await self.pool.release(conn)
+
+    async def get_conn(self):
+        # inside a transaction block its pinned connection is used
+        transaction = current_transaction.get()
+        if transaction is not None:
+            return await transaction.get_conn(self)
+
         if not self.conn:
-            pool = await asyncpg.create_pool(**self.conn_data)
-            self.conn = await pool.acquire()
+            self.conn = await self.acquire()
         return self.conn
 
-    async def request(self, query):
+    async def execute(self, event, run, timeout):
+        '''runs the query on a connection, instrumented and with timeout'''
+        event.manager = self
+        instrumentation.before(event)
+
+        start = perf_counter()
         conn = await self.get_conn()
+        event.wait_time = perf_counter() - start
+
+        self.busy += 1
+        start = perf_counter()
+        try:
+            result = await run(conn)
+            if isinstance(result, list):
+                event.rows = len(result)
+            else:
+                event.rows = result is not None and 1 or 0
+        except Exception as exc:
+            if timed_out(exc):
+                event.error = timeout_error(timeout, event.query)
+                raise event.error
+            event.error = exc
+            raise
+        finally:
+            self.busy -= 1
+            event.execution_time = perf_counter() - start
+            instrumentation.after(event)
+        return result
+
+    async def request(self, query, timeout=None, **details):
+        timeout = self.timeout if timeout is None else timeout
+        transaction = current_transaction.get()
+
+        async def run(conn):
+            if transaction is not None and transaction.atomic:
+                return await conn.fetchrow(query, timeout=timeout)
+            async with conn.transaction():
+                return await conn.fetchrow(query, timeout=timeout)
 
-        async with conn.transaction():
-            return await conn.fetchrow(query)
+        return await self.execute(QueryEvent(query, **details), run, timeout)
+
+    async def fetch(self, query, *args, timeout=None, **details):
+        timeout = self.timeout if timeout is None else timeout
+
+        async def run(conn):
+            return await conn.fetch(query, *args, timeout=timeout)
+
+        return await self.execute(
+            QueryEvent(query, args, **details), run, timeout
+        )
@@ -0,0 +1,285 @@
+import json
+import re
+import uuid
+
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from .db_manager import PostgresManager
+
+__all__ = ['FakeManager', 'Record', 'generate_records']
+
+TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE ONLY|UPDATE)\s+(\w+)', re.I)
+LIMIT = re.compile(r'\bLIMIT\s+(\d+)', re.I)
+OFFSET = re.compile(r'\bOFFSET\s+(\d+)', re.I)
+INSERT = re.compile(
+    r'\((?P<names>[^)]*)\)\s*VALUES\s*\((?P<values>.*)\)', re.S
+)
+UPDATE = re.compile(
+    r'SET\s*\((?P<names>[^)]*)\)\s*=\s*\((?P<values>.*)\)\s*WHERE', re.S
+)
+VALUES = re.compile(r"\s*('(?:[^']|'')*'(?:::\w+)?|[^,]+)\s*(?:,|$)")
+
+
+def sql_value(value):
+    # the python value of a literal in the sql built by the managers
+    if value.startswith("'") and value.endswith('::jsonb'):
+        return json.loads(value[1:-len("'::jsonb")].replace("''", "'"))
+    if value.startswith("'"):
+        return value[1:-1].replace("''", "'")
+    if value.upper() == 'NULL':
+        return None
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def sql_assignments(match):
+    names = [n.strip() for n in match.group('names').split(',')]
+    values = [
+        sql_value(v.strip()) for v in VALUES.findall(match.group('values'))
+    ]
+    return dict(zip(names, values))
+
+
+class Record(OrderedDict):
+    '''the asyncpg Record subset used: by column name or by position'''
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+
+def fake_value(name, field, i):
+    from ..models import fields
+
+    if isinstance(field, (fields.PkField, fields.ManyToManyField)):
+        return None
+    if getattr(field, 'choices', None):
+        return list(field.choices.keys())[0]
+    if isinstance(field, fields.ForeignKey):
+        return 1
+    if isinstance(field, fields.BooleanField):
+        return i % 2 == 0
+    if isinstance(field, fields.IntegerField):
+        return i
+    if isinstance(field, fields.DecimalField):
+        return Decimal(i)
+    if isinstance(field, fields.TimeField):
+        return time(i % 24)
+    if isinstance(field, fields.DateTimeField):
+        return datetime(2017, 1, 1) + timedelta(minutes=i)
+    if isinstance(field, fields.DateField):
+        return date(2017, 1, 1) + timedelta(days=i % 1000)
+    if isinstance(field, fields.Uuid4Field):
+        return str(uuid.uuid4())
+    if isinstance(field, fields.JsonField):
+        return '{}'
+    if isinstance(field, fields.JsonbField):
+        return {}
+    if isinstance(field, fields.EmailField):
+        return 'user{}@example.com'.format(i)
+    if isinstance(field, fields.CharField):
+        return '{} {}'.format(name, i)[:field.max_length]
+    return None
+
+
+def generate_records(model, n, **values):
+    '''n records for the model table, values fixes columns to a value'''
+    records = []
+    for i in range(n):
+        record = Record()
+        for name, field in model.fields.items():
+            if name == model.orm_pk:
+                record[field.db_column] = i + 1
+                continue
+            value = fake_value(name, field, i)
+            if value is not None or getattr(field, 'null', False):
+                record[field.db_column] = value
+        record.update(values)
+        records.append(record)
+    return records
+
+
+class FakeTransaction(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def start(self):
+        self.conn.log.append(('BEGIN', ()))
+
+    async def commit(self):
+        self.conn.log.append(('COMMIT', ()))
+
+    async def rollback(self):
+        self.conn.log.append(('ROLLBACK', ()))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+
+class FakeCursor(object):
+
+    def __init__(self, records):
+        self.records = records
+        self.position = 0
+
+    async def forward(self, n, timeout=None):
+        self.position += n
+
+    async def fetch(self, n, timeout=None):
+        records = self.records[self.position:self.position + n]
+        self.position += n
+        return records
+
+
+class FakeConnection(object):
+    '''the asyncpg connection subset the managers use, in memory'''
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.log = manager.queries
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def fetch(self, query, *args, timeout=None):
+        return self.manager.respond(query, args)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        records = self.manager.respond(query, args)
+        return records[0] if records else None
+
+    async def fetchval(self, query, *args, timeout=None):
+        record = await self.fetchrow(query, *args)
+        return record and record[0]
+
+    async def execute(self, query, *args, timeout=None):
+        self.log.append((query, args))
+        return 'OK'
+
+    async def cursor(self, query, *args, prefetch=None, timeout=None):
+        return FakeCursor(self.manager.respond(query, args))
+
+    async def copy_records_to_table(self, table_name, records=(),
+                                    columns=None, timeout=None):
+        self.log.append(('COPY {}'.format(table_name), ()))
+        rows = self.manager.tables.setdefault(table_name, [])
+        for values in records:
+            rows.append(Record(zip(columns, values)))
+        return 'COPY {}'.format(len(records))
+
+
+class FakePool(object):
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    async def acquire(self):
+        return FakeConnection(self.manager)
+
+    async def release(self, conn):
+        pass
+
+
+class FakeManager(PostgresManager):
+    '''
+    Database manager backed by in memory tables instead of postgres, to
+    profile the orm with no database service. Configure it as the orm
+    manager ('manager': 'FakeManager') and fill its tables with
+    add_records. The selects return the records of their table, only
+    filtered by primary key equality and sliced by LIMIT and OFFSET,
+    the inserts, updates and deletes by primary key change the tables.
+    A responder (callable with the query and its args) can return the
+    records instead, for canned responses
+    '''
+
+    def __init__(self, conn_data):
+        super().__init__(conn_data)
+        self.tables = {}
+        self.primary_keys = {}
+        self.sequences = {}
+        self.queries = []
+        self.responder = None
+
+    async def get_pool(self):
+        if not self.pool:
+            self.pool = FakePool(self)
+        return self.pool
+
+    def add_records(self, model, records):
+        table_name = model.cls_tablename()
+        self.primary_keys[table_name] = model.db_pk
+        self.tables.setdefault(table_name, []).extend(records)
+        self.sequences[table_name] = max(
+            [r.get(model.db_pk) or 0 for r in self.tables[table_name]] or [0]
+        )
+
+    def respond(self, query, args):
+        self.queries.append((query, args))
+        if self.responder is not None:
+            return self.responder(query, args)
+
+        statement = query.split(None, 1)[0].upper()
+        table = TABLE.search(query)
+        if table is None:
+            return []
+        table_name = table.group(1)
+        rows = self.tables.setdefault(table_name, [])
+        pk = self.primary_keys.get(table_name, 'id')
+
+        if statement == 'INSERT':
+            match = INSERT.search(query)
+            record = Record(sql_assignments(match) if match else {})
+            self.sequences[table_name] = self.sequences.get(table_name, 0) + 1
+            record[pk] = self.sequences[table_name]
+            rows.append(record)
+            return [record]
+
+        matches = self.by_pk(query, rows, pk)
+        if statement == 'UPDATE':
+            match = UPDATE.search(query)
+            for record in matches:
+                record.update(sql_assignments(match) if match else {})
+            return matches
+        if statement == 'DELETE':
+            self.tables[table_name] = [r for r in rows if r not in matches]
+            return []
+
+        if re.search(r'^\s*SELECT\s+COUNT\(\*\)', query, re.I):
+            return [Record(count=len(matches))]
+
+        offset = OFFSET.search(query)
+        offset = offset and int(offset.group(1)) or 0
+        limit = LIMIT.search(query)
+        limit = limit and int(limit.group(1))
+        matches = matches[offset:]
+        return limit is None and matches or matches[:limit]
+
+    @staticmethod
+    def by_pk(query, rows, pk):
+        where = query.upper().find('WHERE')
+        if where < 0:
+            return list(rows)
+        value = re.search(
+            r'\b{}\s*=\s*(\d+)'.format(pk), query[where:]
+        )
+        if value is None:
+            return list(rows)
+        value = int(value.group(1))
+        return [r for r in rows if r.get(pk) == value]
@@ -0,0 +1,146 @@
+import re
+
+__all__ = ['Instrumentation', 'QueryEvent', 'QueryStats', 'fingerprint']
+
+# upper limits, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float('inf'))
+
+LITERALS = re.compile(
+    r"'(?:[^']|'')*'|\$\d+|\b\d+(?:\.\d+)?\b|\bTRUE\b|\bFALSE\b|\bNULL\b",
+    re.IGNORECASE
+)
+LISTS = re.compile(r'([(\[])\s*\?(?:\s*,\s*\?)*\s*([)\]])')
+SPACES = re.compile(r'\s+')
+
+
+def fingerprint(query):
+    '''
+    the shape of the query: the literals and parameters are replaced by ?
+    so the same query with different values has the same fingerprint
+    '''
+    shape = LITERALS.sub('?', query)
+    shape = LISTS.sub(r'\1?\2', shape)
+    return SPACES.sub(' ', shape).strip()
+
+
+class QueryEvent(object):
+    '''what is known about a query, handed to the instrumentation hooks'''
+
+    def __init__(self, query, args=(), model=None, operation=None,
+                 accessor=None, build_time=0.0):
+        self.query = query
+        self.args = args
+        self.model = model
+        # the model accessor that built the queryset, as Author.book_set
+        self.accessor = accessor
+        self.operation = operation or query.split(None, 1)[0].lower()
+        self.build_time = build_time
+        # seconds waiting for the connection, and running the query
+        self.wait_time = 0.0
+        self.execution_time = 0.0
+        self.rows = None
+        self.error = None
+        # the database manager that runs it, when known
+        self.manager = None
+        self._shape = None
+
+    @property
+    def shape(self):
+        # fingerprinted once, however many hooks ask for it
+        if self._shape is None:
+            self._shape = fingerprint(self.query)
+        return self._shape
+
+
+class QueryStats(object):
+    '''aggregated timings of all the queries that share a shape'''
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, event):
+        self.count += 1
+        self.errors += event.error is not None and 1 or 0
+        self.rows += event.rows or 0
+        self.total_time += event.execution_time
+        self.max_time = max(self.max_time, event.execution_time)
+        for i, limit in enumerate(LATENCY_BUCKETS):
+            if event.execution_time <= limit:
+                self.histogram[i] += 1
+                break
+
+    @property
+    def mean_time(self):
+        return self.count and self.total_time / self.count or 0.0
+
+    def as_dict(self):
+        return {
+            'shape': self.shape,
+            'count': self.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_time': self.total_time,
+            'mean_time': self.mean_time,
+            'max_time': self.max_time,
+            'histogram': dict(zip(
+                [str(b) for b in LATENCY_BUCKETS], self.histogram
+            )),
+        }
+
+
+class Instrumentation(object):
+    '''
+    The hooks called before and after every query, with its QueryEvent,
+    and the statistics of the queries executed by shape, only collected
+    when collect_stats is set
+    '''
+
+    def __init__(self, collect_stats=False):
+        self.before_hooks = []
+        self.after_hooks = []
+        self.stats = {}
+        self.collect_stats = collect_stats
+
+    def add_hooks(self, before=None, after=None):
+        if before is not None:
+            self.before_hooks.append(before)
+        if after is not None:
+            self.after_hooks.append(after)
+
+    def remove_hooks(self, before=None, after=None):
+        if before in self.before_hooks:
+            self.before_hooks.remove(before)
+        if after in self.after_hooks:
+            self.after_hooks.remove(after)
+
+    def before(self, event):
+        for hook in self.before_hooks:
+            hook(event)
+
+    def after(self, event):
+        if self.collect_stats:
+            shape = event.shape
+            if shape not in self.stats:
+                self.stats[shape] = QueryStats(shape)
+            self.stats[shape].add(event)
+
+        for hook in self.after_hooks:
+            hook(event)
+
+    def top(self, n=10, key='total_time'):
+        '''the n query shapes with the highest key, the hot queries'''
+        return sorted(
+            self.stats.values(), key=lambda s: getattr(s, key), reverse=True
+        )[:n]
+
+    def reset(self):
+        self.stats = {}
+
+
+instrumentation = Instrumentation()
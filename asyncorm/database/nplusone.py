@@ -0,0 +1,80 @@
+from contextvars import ContextVar
+
+from ..exceptions import NPlusOneError
+from ..log import logger
+from .instrumentation import instrumentation
+from .slow_queries import caller_frame
+
+__all__ = ['NPlusOneDetector']
+
+current_detector = ContextVar('current_detector', default=None)
+
+
+def record_in_scope(event):
+    detector = current_detector.get()
+    if detector is not None:
+        detector.record(event)
+
+
+class NPlusOneDetector(object):
+    '''
+    Scope, as context manager, where the query shapes are counted and
+    the ones executed more than threshold times are reported as N+1
+    queries: logged as a warning, and when raise_error NPlusOneError is
+    raised leaving the scope (unless it is left by another exception).
+    The tasks started inside share the scope
+    '''
+    # scopes open, the hook is only installed while there is any
+    active_scopes = 0
+
+    def __init__(self, threshold=5, raise_error=False):
+        self.threshold = threshold
+        self.raise_error = raise_error
+        self.counts = {}
+        self.reported = []
+        self.messages = []
+        self.token = None
+
+    def record(self, event):
+        shape = event.shape
+        self.counts[shape] = self.counts.get(shape, 0) + 1
+        if self.counts[shape] <= self.threshold or shape in self.reported:
+            return
+
+        self.reported.append(shape)
+        message = (
+            'N+1 queries: the same {} query run {} times, '
+            'by {} from {}: {}'.format(
+                event.model or 'raw',
+                self.counts[shape],
+                event.accessor or 'no accessor',
+                caller_frame(),
+                shape,
+            )
+        )
+        # raised at the end of the scope, a hook must not mask the query
+        # outcome nor skip the rest of hooks
+        self.messages.append(message)
+        logger.warning(message)
+
+    def __enter__(self):
+        if not NPlusOneDetector.active_scopes:
+            instrumentation.add_hooks(after=record_in_scope)
+        NPlusOneDetector.active_scopes += 1
+        self.token = current_detector.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_detector.reset(self.token)
+        NPlusOneDetector.active_scopes -= 1
+        if not NPlusOneDetector.active_scopes:
+            instrumentation.remove_hooks(after=record_in_scope)
+
+        if self.raise_error and self.messages and exc_type is None:
+            raise NPlusOneError('\n'.join(self.messages))
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
@@ -0,0 +1,35 @@
+from zlib import crc32
+
+__all__ = ['RoundRobinRouter', 'LeastBusyRouter', 'ROUTERS', 'shard_by_hash']
+
+
+class RoundRobinRouter(object):
+    '''each read goes to the next replica'''
+
+    def __init__(self):
+        self.index = 0
+
+    def __call__(self, replicas):
+        replica = replicas[self.index % len(replicas)]
+        self.index += 1
+        return replica
+
+
+class LeastBusyRouter(object):
+    '''each read goes to the replica with less requests in progress'''
+
+    def __call__(self, replicas):
+        return min(replicas, key=lambda r: r.busy)
+
+
+ROUTERS = {
+    'round_robin': RoundRobinRouter,
+    'least_busy': LeastBusyRouter,
+}
+
+
+def shard_by_hash(value, shards):
+    '''index of the shard for that shard key value, stable across runs'''
+    if isinstance(value, int):
+        return value % shards
+    return crc32(str(value).encode()) % shards
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+from collections import deque
+
+from ..log import logger
+from .transactions import Transaction
+
+__all__ = ['SlowQueryLog']
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASYNCIO_DIR = os.path.dirname(os.path.abspath(asyncio.__file__))
+
+
+def caller_frame():
+    '''the innermost frame, out of asyncorm and asyncio, of the query'''
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith((PACKAGE_DIR, ASYNCIO_DIR)):
+            return '{}:{} in {}'.format(
+                filename, frame.f_lineno, frame.f_code.co_name
+            )
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog(object):
+    '''
+    Records the queries slower than threshold (in seconds) in a ring
+    buffer that keeps the last size ones, and logs them as warnings.
+    The plan of the first explain occurrences of each select shape is
+    captured too, and the parameters are hidden when redact is set
+    '''
+
+    def __init__(self, threshold, size=100, explain=0, redact=True):
+        self.threshold = threshold
+        self.queries = deque(maxlen=size)
+        self.explain = explain
+        self.redact = redact
+        # times each query shape has been explained
+        self.explained = {}
+        # the plans being captured, referenced until done
+        self._tasks = set()
+
+    def install(self, instrumentation):
+        instrumentation.add_hooks(after=self.record)
+
+    def uninstall(self, instrumentation):
+        instrumentation.remove_hooks(after=self.record)
+
+    def record(self, event):
+        if event.execution_time < self.threshold:
+            return
+
+        shape = event.shape
+        slow_query = {
+            'time': time.time(),
+            'duration': event.execution_time,
+            'model': event.model,
+            'operation': event.operation,
+            'shape': shape,
+            # the fingerprint has no literals, so nothing to leak
+            'query': self.redact and shape or event.query,
+            'args': self.redact and ['?'] * len(event.args) or list(
+                event.args
+            ),
+            'caller': caller_frame(),
+            'plan': None,
+        }
+        self.queries.append(slow_query)
+        logger.warning(
+            'SLOW QUERY (%.3fs): %s, from %s',
+            event.execution_time, slow_query['query'], slow_query['caller'],
+        )
+
+        explainable = event.manager is not None and (
+            event.query.lstrip().upper().startswith('SELECT')
+        )
+        if explainable and self.explained.get(shape, 0) < self.explain:
+            self.explained[shape] = self.explained.get(shape, 0) + 1
+            task = asyncio.ensure_future(self.capture_plan(slow_query, event))
+            self._tasks.add(task)
+            task.add_done_callback(self.captured)
+
+    def captured(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning('SLOW QUERY not explained: %s', task.exception())
+
+    async def capture_plan(self, slow_query, event):
+        manager = event.manager
+        query = manager.db__explain.format(
+            options='FORMAT JSON', query=event.query
+        )
+        try:
+            # on a connection of its own, the query's one could be busy
+            async with Transaction(atomic=False):
+                records = await manager.fetch(
+                    query, *event.args, operation='explain'
+                )
+        except Exception as exc:
+            logger.warning('SLOW QUERY not explained: %s', exc)
+            return
+
+        plan = records[0][0]
+        slow_query['plan'] = isinstance(plan, str) and json.loads(plan) or plan
@@ -0,0 +1,99 @@
+import asyncio
+from contextvars import ContextVar
+
+from ..log import logger
+
+__all__ = ['Transaction', 'current_transaction', 'gather']
+
+current_transaction = ContextVar('current_transaction', default=None)
+
+
+class Transaction(object):
+    '''
+    Pins one pooled connection per database for the whole block, the
+    nested blocks are savepoints on the same connections.
+    When not atomic the connections are only pinned, with no transaction
+    '''
+
+    def __init__(self, atomic=True):
+        self.atomic = atomic
+        self.parent = None
+        self.connections = {}
+        self.acquired = []
+        self.transactions = []
+        self.token = None
+
+    async def get_conn(self, manager):
+        # the connection is only acquired when the database is used
+        if manager not in self.connections:
+            if self.atomic and self.parent is not None:
+                conn = await self.parent.get_conn(manager)
+            else:
+                conn = await manager.acquire()
+                self.acquired.append((manager, conn))
+            if self.atomic:
+                transaction = conn.transaction()
+                await transaction.start()
+                self.transactions.append(transaction)
+
+            self.connections[manager] = conn
+        return self.connections[manager]
+
+    async def __aenter__(self):
+        self.parent = current_transaction.get()
+        self.token = current_transaction.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        current_transaction.reset(self.token)
+        # innermost first, the ones left when a commit fails (or all of
+        # them on error) are rolled back
+        pending = list(reversed(self.transactions))
+        try:
+            while exc_type is None and pending:
+                await pending.pop(0).commit()
+        finally:
+            try:
+                for transaction in pending:
+                    await rollback(transaction)
+            finally:
+                for manager, conn in self.acquired:
+                    await manager.release(conn)
+
+
+async def rollback(transaction):
+    # one failed rollback does not stop the rest
+    try:
+        await transaction.rollback()
+    except Exception as exc:
+        logger.warning('Transaction not rolled back: %s', exc)
+
+
+async def evaluate(awaitable):
+    # the querysets are evaluated as the list of their items
+    if hasattr(awaitable, '__aiter__'):
+        results = []
+        async for item in awaitable:
+            results.append(item)
+        return results
+    return await awaitable
+
+
+async def gather(awaitables, concurrency):
+    '''
+    awaits the querysets and coroutines concurrently, each one on its own
+    pooled connection, and returns their results in the same order
+    '''
+    transaction = current_transaction.get()
+    if transaction is not None and transaction.atomic:
+        # the connection pinned by the transaction can not multiplex
+        return [await evaluate(a) for a in awaitables]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def pinned(awaitable):
+        async with semaphore:
+            async with Transaction(atomic=False):
+                return await evaluate(awaitable)
+
+    return await asyncio.gather(*[pinned(a) for a in awaitables])
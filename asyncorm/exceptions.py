@@ -1,7 +1,8 @@
 __all__ = (
     'AsyncormException', 'FieldError', 'ModelDoesNotExist',
     'ModelError', 'ModuleError', 'MultipleObjectsReturned', 'QuerysetError',
-    'SerializerError', 'ConfigError', 'CommandError', 'MigrationError'
+    'SerializerError', 'ConfigError', 'CommandError', 'MigrationError',
+    'QueryTimeoutError', 'NPlusOneError',
 )
 
 
@@ -29,6 +30,16 @@ class QuerysetError(AsyncormException):
     pass
 
 
+class QueryTimeoutError(AsyncormException):
+    '''to be raised when a query exceeds its statement timeout'''
+    pass
+
+
+class NPlusOneError(AsyncormException):
+    '''to be raised when the same query is repeated once per row'''
+    pass
+
+
 class ConfigError(AsyncormException):
     '''to be raised when there are configuration errors detected'''
     pass
@@ -1,3 +1,11 @@
 from .managers import Queryset, ModelManager
+from .loaders import ModelLoader
+from .aggregates import Aggregate, Avg, Count, Max, Min, StdDev, Sum
+from .functions import Trunc
+from .plans import QueryPlan
 
-__all__ = ['Queryset', 'ModelManager']
+__all__ = [
+    'Queryset', 'ModelManager', 'ModelLoader',
+    'Aggregate', 'Avg', 'Count', 'Max', 'Min', 'StdDev', 'Sum', 'Trunc',
+    'QueryPlan',
+]
@@ -0,0 +1,68 @@
+from ..exceptions import QuerysetError
+from ..models.fields import NumberField
+
+__all__ = ['Aggregate', 'Avg', 'Count', 'Max', 'Min', 'StdDev', 'Sum']
+
+
+class Aggregate(object):
+    function = None
+    numeric = True
+
+    def __init__(self, field_name, function=None):
+        self.field_name = field_name
+        if function is not None:
+            self.function = function
+
+    def get_field(self, model):
+        if not hasattr(model, self.field_name):
+            raise QuerysetError(
+                '{} wrong field name for model {}'.format(
+                    self.field_name,
+                    model.__name__
+                )
+            )
+        field = getattr(model, self.field_name)
+
+        if self.numeric and not isinstance(field, NumberField):
+            raise QuerysetError(
+                '{} is not a numeric field'.format(self.field_name)
+            )
+        return field
+
+    def as_sql(self, model):
+        field = self.get_field(model)
+        return '{function}({t_n}.{k})'.format(
+            function=self.function,
+            t_n=model.table_name or model.__name__.lower(),
+            k=field.db_column,
+        )
+
+
+class Avg(Aggregate):
+    function = 'AVG'
+
+
+class Max(Aggregate):
+    function = 'MAX'
+
+
+class Min(Aggregate):
+    function = 'MIN'
+
+
+class StdDev(Aggregate):
+    function = 'STDDEV'
+
+
+class Sum(Aggregate):
+    function = 'SUM'
+
+
+class Count(Aggregate):
+    function = 'COUNT'
+    numeric = False
+
+    def as_sql(self, model):
+        if self.field_name == '*':
+            return 'COUNT(*)'
+        return super().as_sql(model)
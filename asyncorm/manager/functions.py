@@ -0,0 +1,42 @@
+from ..exceptions import QuerysetError
+from ..models.fields import DateField
+
+__all__ = ['Trunc']
+
+TRUNC_KINDS = (
+    'year', 'quarter', 'month', 'week', 'day', 'hour', 'minute', 'second',
+)
+
+
+class Trunc(object):
+    '''date_trunc the field to the kind precision, to bucket dates'''
+
+    def __init__(self, field_name, kind):
+        if kind not in TRUNC_KINDS:
+            raise QuerysetError(
+                '{} is not a correct kind, choose from: {}'.format(
+                    kind, ', '.join(TRUNC_KINDS)
+                )
+            )
+        self.field_name = field_name
+        self.kind = kind
+
+    def as_sql(self, model):
+        if not hasattr(model, self.field_name):
+            raise QuerysetError(
+                '{} wrong field name for model {}'.format(
+                    self.field_name,
+                    model.__name__
+                )
+            )
+        field = getattr(model, self.field_name)
+
+        if not isinstance(field, DateField):
+            raise QuerysetError(
+                '{} is not a date field'.format(self.field_name)
+            )
+        return 'date_trunc(\'{kind}\', {t_n}.{k})'.format(
+            kind=self.kind,
+            t_n=model.table_name or model.__name__.lower(),
+            k=field.db_column,
+        )
@@ -0,0 +1,87 @@
+import asyncio
+
+from ..log import logger
+
+__all__ = ['ModelLoader']
+
+
+class ModelLoader(object):
+    '''
+    Coalesces the lookups by field value issued in the same loop iteration
+    in one in_bulk request, optionally memoizing the results so each of the
+    values is only requested once during the loader life
+    '''
+
+    def __init__(self, queryset, field=None, cache=True):
+        self.queryset = queryset
+        self.field = field or queryset.model.orm_pk
+        self.cache = cache
+
+        self._futures = {}
+        self._pending = {}
+        # the resolving tasks are referenced until done, so they are not
+        # garbage collected
+        self._tasks = set()
+
+    def load(self, key):
+        if key in self._futures:
+            return self._futures[key]
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        # the first lookup in this loop iteration schedules the dispatch
+        if not self._pending:
+            loop.call_soon(self.dispatch)
+
+        self._pending[key] = future
+        self._futures[key] = future
+        return future
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*[self.load(k) for k in keys])
+
+    def clear(self, key=None):
+        if key is None:
+            self._futures = {}
+        else:
+            self._futures.pop(key, None)
+
+    def dispatch(self):
+        pending, self._pending = self._pending, {}
+        if not self.cache:
+            self._futures = {}
+
+        task = asyncio.ensure_future(self.resolve(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self.resolved)
+
+    def resolved(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Loader not resolved: %s', task.exception())
+
+    async def resolve(self, pending):
+        try:
+            results = await self.queryset.in_bulk(
+                list(pending.keys()), field=self.field
+            )
+        except Exception as exc:
+            for key, future in pending.items():
+                # do not memoize the failures, but keep the newer lookups
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        model = self.queryset.model
+        for key, future in pending.items():
+            if future.done():
+                continue
+            if key in results:
+                future.set_result(results[key])
+            else:
+                future.set_exception(model.DoesNotExist(
+                    'That {} does not exist'.format(model.__name__)
+                ))
@@ -1,16 +1,36 @@
+import asyncio
+import base64
+import json
+import time
+
 from asyncpg.exceptions import UniqueViolationError, InsufficientPrivilegeError
+from binascii import Error as BinasciiError
+from collections import OrderedDict, deque
 from copy import deepcopy
 
 from ..exceptions import (
     ModelDoesNotExist, ModelError, MultipleObjectsReturned, QuerysetError,
 )
 
-from ..models.fields import ManyToManyField, ForeignKey, CharField, NumberField
+from ..models.fields import (
+    Field, ManyToManyField, ForeignKey, CharField, JsonbField,
+)
 from ..database import Cursor
+from ..database.transactions import current_transaction
+from .aggregates import Aggregate
+from .functions import Trunc
+from .loaders import ModelLoader
+from .plans import QueryPlan
 # from .log import logger
 
 __all__ = ['ModelManager', 'Queryset']
 
+# max number of values sent in each of the in_bulk requests
+IN_BULK_SIZE = 1000
+
+# max number of counts cached, the least recently used ones are dropped
+COUNT_CACHE_SIZE = 1000
+
 LOOKUP_OPERATOR = {
     'gt': '{t_n}.{k} > {v}',
     'lt': '{t_n}.{k} < {v}',
@@ -30,11 +50,56 @@ LOOKUP_OPERATOR = {
     'iregex': '{t_n}.{k} ~* {v}',
 }
 
+# the jsonb lookups, all of them can use the GIN index of the field
+JSONB_LOOKUP_OPERATOR = {
+    'contains': '{t_n}.{k} @> {v}',
+    'has_key': '{t_n}.{k} ? {v}',
+    'path': '{t_n}.{k} @> {v}',
+}
+
+
+def keyset_value(value):
+    # the values that json can not represent travel as strings
+    if value is None:
+        raise QuerysetError('Keyset pagination values can not be null')
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def keyset_literal(value):
+    value = keyset_value(value)
+    if isinstance(value, bool):
+        return value and 'true' or 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '\'{}\''.format(value.replace('\'', '\'\''))
+
+
+def encode_keyset_token(ordering, values):
+    token = json.dumps({
+        'ordering': ordering,
+        'values': [keyset_value(v) for v in values],
+    })
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+def decode_keyset_token(token):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        return token['ordering'], token['values']
+    except (BinasciiError, ValueError, TypeError, KeyError):
+        raise QuerysetError('Not a valid keyset pagination token')
+
 
 class Queryset(object):
     db_manager = None
     orm = None
 
+    # exact counts cached by query: {query: (expiration time, count)},
+    # in least recently used order
+    count_cache = OrderedDict()
+
     def __init__(self, model):
         self.model = model
 
@@ -42,13 +107,14 @@ class Queryset(object):
         self.select = '*'
 
         self.query = None
+        self.db_alias = None
+        self.shard_value = None
+        self.statement_timeout = None
+        # the model accessor (like author.book_set) that built the queryset
+        self.accessor = None
 
         self._cursor = None
-        self._results = []
-
-        self.forward = 0
-        self.stop = None
-        self.step = None
+        self._results = deque()
 
     def query_copy(self):
         return (
@@ -70,6 +136,105 @@ class Queryset(object):
         cls.orm = orm
         cls.db_manager = orm.db_manager
 
+    @property
+    def sharded(self):
+        '''the model is sharded, and there are shards configured'''
+        if self.model.shard_key is None:
+            return False
+        return bool(self.db_manager.shards)
+
+    def check_pk_lookup(self, field_name):
+        '''
+        the primary keys are serials of each shard, so they only identify
+        a row when the shard is known
+        '''
+        scatter = len(self.shard_managers(read=True)) > 1
+        if scatter and field_name == self.model.orm_pk:
+            raise QuerysetError(
+                'The {} primary keys are only unique by shard, filter by the '
+                'shard key {} too'.format(
+                    self.model.__name__, self.model.shard_key
+                )
+            )
+
+    def shard_managers(self, read=False, shard_value=None):
+        '''
+        the database managers the request goes to: the shard that holds the
+        shard key value, or all of them when the value is unknown
+        '''
+        if shard_value is None:
+            shard_value = self.shard_value
+
+        if not self.sharded:
+            managers = [self.db_manager]
+        elif shard_value is not None:
+            managers = [self.db_manager.shard_for(shard_value)]
+        else:
+            managers = self.db_manager.shards
+
+        return [m.route(read=read, using=self.db_alias) for m in managers]
+
+    def construct_query(self, query_chain, operation=None):
+        '''
+        the sql for the query chain, and the details (model, operation
+        and time it took to build) for the instrumentation
+        '''
+        start = time.perf_counter()
+        query = self.db_manager.construct_query(query_chain)
+        return query, {
+            'model': self.model.__name__,
+            'operation': operation,
+            'accessor': self.accessor,
+            'build_time': time.perf_counter() - start,
+        }
+
+    async def fetch_records(self, query, *args, operation=None):
+        '''fetches the records for that query chain, from all the shards'''
+        managers = self.shard_managers(read=True)
+        if len(managers) == 1:
+            query, details = self.construct_query(query, operation)
+            return await managers[0].fetch(
+                query, *args, timeout=self.statement_timeout, **details
+            )
+
+        if query[0].get('annotations'):
+            raise QuerysetError(
+                'Can not annotate across shards, filter by the shard key'
+            )
+
+        # each shard returns up to the last row requested, then the merged
+        # records are sorted and sliced as the query would have done
+        offset = query[0].get('offset') or 0
+        limit = query[0].get('limit')
+        query[0].update({
+            'offset': None,
+            'limit': None if limit is None else offset + limit,
+        })
+        ordering = query[0].get('ordering')
+        query, details = self.construct_query(query, operation)
+
+        results = await asyncio.gather(*[
+            m.fetch(query, *args, timeout=self.statement_timeout, **details)
+            for m in managers
+        ])
+        records = self.db_manager.sort_records(
+            [rec for result in results for rec in result], ordering
+        )
+        records = records[offset:]
+        return records if limit is None else records[:limit]
+
+    async def shards_request(self, query, **details):
+        '''the single row response of each of the shards'''
+        managers = self.shard_managers(read=True)
+        timeout = self.statement_timeout
+        if len(managers) == 1:
+            return [
+                await managers[0].request(query, timeout=timeout, **details)
+            ]
+        return await asyncio.gather(*[
+            m.request(query, timeout=timeout, **details) for m in managers
+        ])
+
     def get_field_queries(self):
         '''Builds the creationquery for each of the non fk or m2m fields'''
         return ', '.join([
@@ -93,7 +258,8 @@ class Queryset(object):
         '''Add to the database the table requirements if needed'''
         try:
             for query in self.model.field_requirements:
-                await self.db_manager.request(query)
+                for db_manager in self.shard_managers():
+                    await db_manager.request(query)
         except InsufficientPrivilegeError:
             raise ModelError(
                 'Not enought privileges to add the needed requirement '
@@ -122,7 +288,10 @@ class Queryset(object):
         return [{
             'table_name': self.model.cls_tablename(),
             'action': 'db__table_add_column',
-            'field_creation_string': field.creation_query(),
+            # the referenced rows can be in another shard
+            'field_creation_string': field.creation_query(
+                references=not self.sharded
+            ),
         }]
 
     async def add_fk_columns(self):
@@ -133,12 +302,13 @@ class Queryset(object):
             if isinstance(f, ForeignKey):
                 await self.db_request(self.add_fk_field_builder(f))
 
-    @staticmethod
-    def add_m2m_columns_builder(field):
+    def add_m2m_columns_builder(self, field):
         return [{
             'table_name': field.table_name,
             'action': 'db__create_table',
-            'field_queries': field.creation_query(),
+            'field_queries': field.creation_query(
+                references=not self.sharded
+            ),
         }]
 
     async def add_m2m_columns(self):
@@ -149,6 +319,22 @@ class Queryset(object):
             if isinstance(f, ManyToManyField):
                 await self.db_request(self.add_m2m_columns_builder(f))
 
+    def create_indexes_builder(self):
+        return [[{
+            'action': 'db__create_index',
+            'index_name': '{}_{}_idx'.format(
+                self.model.cls_tablename(), f.db_column
+            ),
+            'table_name': self.model.cls_tablename(),
+            'index_method': f.index_method,
+            'db_column': f.db_column,
+        }] for f in self.model.fields.values() if getattr(f, 'index', False)]
+
+    async def create_indexes(self):
+        '''Builds the indexes of the fields that ask for one'''
+        for db_request in self.create_indexes_builder():
+            await self.db_request(db_request)
+
     def get_unique_together(self):
         # builds the table with all its fields definition
         unique_string = ' UNIQUE ({}) '.format(
@@ -157,6 +343,10 @@ class Queryset(object):
         return self.model.unique_together and unique_string or ''
 
     def modelconstructor(self, record, instance=None):
+        # values querysets return the rows as dictionaries
+        if self.query and self.query[0].get('values'):
+            return dict(record.items())
+
         if not instance:
             instance = self.model()
 
@@ -178,41 +368,237 @@ class Queryset(object):
 
     #               QUERYSET METHODS
     #               ENDING QUERYSETS
-    async def count(self):
+    async def count(self, estimate=False, cache_ttl=None):
+        '''
+        estimate: the planner row estimation instead of the exact count,
+            way cheaper on big tables
+        cache_ttl: seconds the exact count is cached for that same query
+        '''
+        if estimate:
+            return await self.count_estimate()
+
         query = self.query_copy()
-        query[0]['select'] = 'COUNT(*)'
+        grouped = bool(query[0].get('annotations'))
+        if grouped and len(self.shard_managers(read=True)) > 1:
+            raise QuerysetError(
+                'Can not annotate across shards, filter by the shard key'
+            )
+        if not grouped:
+            query[0]['select'] = 'COUNT(*)'
+
+        query, details = self.construct_query(query, 'count')
+        if grouped:
+            query = self.db_manager.db__count_grouped.format(
+                query=query.rstrip(';')
+            )
 
-        resp = await self.db_request(query)
-        for v in resp.values():
-            return v
+        if cache_ttl is not None:
+            cache_key = query
+            count = self.cached_count(cache_key)
+            if count is not None:
+                return count
 
-    async def exists(self):
-        query = self.query_copy()
-        query[0]['action'] = 'db__exists'
+        count = 0
+        for resp in await self.shards_request(query, **details):
+            for v in resp.values():
+                count += v
 
-        resp = await self.db_request(query)
-        for v in resp.values():
-            return v
+        if cache_ttl is not None:
+            self.cache_count(cache_key, cache_ttl, count)
+        return count
 
-    async def calculate(self, field_name, operation):
-        if hasattr(self.model, field_name):
-            field = getattr(self.model, field_name)
-        else:
+    @classmethod
+    def cached_count(cls, cache_key):
+        '''the count cached for that query, None when expired or missing'''
+        expiration, count = cls.count_cache.get(cache_key, (0, None))
+        if expiration > time.monotonic():
+            cls.count_cache.move_to_end(cache_key)
+            return count
+        cls.count_cache.pop(cache_key, None)
+        return None
+
+    @classmethod
+    def cache_count(cls, cache_key, ttl, count):
+        now = time.monotonic()
+        expired = [
+            k for k, (expiration, c) in cls.count_cache.items()
+            if expiration <= now
+        ]
+        for k in expired:
+            del cls.count_cache[k]
+
+        cls.count_cache[cache_key] = (now + ttl, count)
+        cls.count_cache.move_to_end(cache_key)
+        while len(cls.count_cache) > COUNT_CACHE_SIZE:
+            cls.count_cache.popitem(last=False)
+
+    async def count_estimate(self):
+        query = self.query_copy()
+        filtered = query[0]['action'] != 'db__select_all' or any(
+            q['action'] == 'db__where' for q in query[1:]
+        ) or bool(query[0].get('annotations'))
+
+        if not filtered:
+            # the statistics already hold the row count for the table
+            query = self.db_manager.db__count_estimate.format(
+                table_name=self.model.cls_tablename()
+            )
+            estimate = 0
+            details = {'model': self.model.__name__, 'operation': 'count'}
+            for resp in await self.shards_request(query, **details):
+                for v in resp.values():
+                    # tables never analyzed have no estimation, -1 or 0
+                    # depending on the postgres version
+                    if v is None or v <= 0:
+                        return await self.count()
+                    estimate += v
+            return estimate
+
+        query[0].update({'ordering': None, 'limit': None, 'offset': None})
+        query, details = self.construct_query(query, 'count')
+        query = self.db_manager.db__explain.format(
+            options='FORMAT JSON', query=query,
+        )
+        estimate = 0
+        for resp in await self.shards_request(query, **details):
+            for v in resp.values():
+                plan = isinstance(v, str) and json.loads(v) or v
+                estimate += plan[0]['Plan']['Plan Rows']
+        return estimate
+
+    async def explain(self, analyze=False, buffers=False, format='json'):
+        '''
+        the plan for the query of this queryset, parsed into a QueryPlan
+        (format json) or as the text postgres shows (format text).
+        analyze executes the query to show the actual times and rows
+        '''
+        if format not in ('json', 'text'):
             raise QuerysetError(
-                '{} wrong field name for model {}'.format(
-                    field_name,
-                    self.model.__name__
+                '{} is not a correct format, choose from: json, text'.format(
+                    format
                 )
             )
-        if not isinstance(field, NumberField):
-            raise QuerysetError('{} is not a numeric field'.format(field_name))
+        if buffers and not analyze:
+            raise QuerysetError('buffers can only be shown with analyze')
+
+        options = ['FORMAT {}'.format(format.upper())]
+        if analyze:
+            options.append('ANALYZE')
+        if buffers:
+            options.append('BUFFERS')
+
+        query, details = self.construct_query(self.query_copy(), 'explain')
+        query = self.db_manager.db__explain.format(
+            options=', '.join(options), query=query,
+        )
+        # sharded querysets show the plan of the first shard
+        records = await self.shard_managers(read=True)[0].fetch(
+            query, timeout=self.statement_timeout, **details
+        )
+
+        if format == 'text':
+            return '\n'.join([rec[0] for rec in records])
+        plan = records[0][0]
+        return QueryPlan(isinstance(plan, str) and json.loads(plan) or plan)
+
+    async def select_json(self, json_object):
+        '''
+        the rows of the queryset as a json array (text) built by the
+        database, each row rendered by the json_object sql expression
+        '''
+        managers = self.shard_managers(read=True)
+        if len(managers) > 1:
+            raise QuerysetError(
+                'Can not render json across shards, filter by the shard key'
+            )
 
         query = self.query_copy()
-        query[0]['select'] = '{}({})'.format(operation, field_name)
+        query[0].update({'values': None, 'annotations': []})
+        query, details = self.construct_query(query, 'json')
+        # json_agg keeps the order of the rows of the subquery
+        query = self.db_manager.db__select_json.format(
+            json_object=json_object,
+            query=query.rstrip(';'),
+            table_name=self.table_name,
+        )
+        records = await managers[0].fetch(
+            query, timeout=self.statement_timeout, **details
+        )
+        return records[0][0]
+
+    async def exists(self):
+        # one row is enough, no matter which one, so no ordering, joins or
+        # columns are needed
+        query = [
+            q for q in self.query_copy()
+            if q['action'] != 'db__select_related'
+        ]
+        limit = query[0].get('limit')
+        query[0].update({
+            'select': '1',
+            'ordering': None,
+            'limit': limit is None and 1 or min(limit, 1),
+            'values': None,
+            'annotations': [],
+        })
 
-        resp = await self.db_request(query)
-        for v in resp.values():
-            return v
+        return bool(await self.fetch_records(query, operation='exists'))
+
+    async def aggregate(self, **kwargs):
+        '''
+        Calculates all the aggregations requested in one single query,
+        returns a dictionary with the results by keyword
+        '''
+        if not kwargs:
+            raise QuerysetError('aggregate needs at least one aggregation')
+        if self.query and self.query[0].get('annotations'):
+            raise QuerysetError('Can not aggregate the annotated groups')
+
+        scatter = len(self.shard_managers(read=True)) > 1
+        select = []
+        for name, aggregation in kwargs.items():
+            if not isinstance(aggregation, Aggregate):
+                raise QuerysetError(
+                    '{} is not an aggregation'.format(name)
+                )
+            if scatter and aggregation.function in ('AVG', 'STDDEV'):
+                raise QuerysetError(
+                    '{} can not be calculated across shards, filter by the '
+                    'shard key'.format(aggregation.function)
+                )
+            select.append('{} AS "{}"'.format(
+                aggregation.as_sql(self.model), name
+            ))
+
+        query = self.query_copy()
+        query[0]['select'] = ', '.join(select)
+        query, details = self.construct_query(query, 'aggregate')
+
+        responses = await self.shards_request(query, **details)
+        if len(responses) == 1:
+            return dict(responses[0].items())
+
+        # merge the results of each shard
+        result = {}
+        for name, aggregation in kwargs.items():
+            values = [
+                resp[name] for resp in responses if resp[name] is not None
+            ]
+            if not values:
+                result[name] = aggregation.function == 'COUNT' and 0 or None
+            elif aggregation.function in ('COUNT', 'SUM'):
+                result[name] = sum(values)
+            elif aggregation.function == 'MAX':
+                result[name] = max(values)
+            else:
+                result[name] = min(values)
+        return result
+
+    async def calculate(self, field_name, operation):
+        resp = await self.aggregate(
+            result=Aggregate(field_name, function=operation)
+        )
+        return resp['result']
 
     async def Max(self, field_name):
         return await self.calculate(field_name, 'MAX')
@@ -231,6 +617,8 @@ class Queryset(object):
 
     async def get(self, **kwargs):
         queryset = self.queryset().filter(**kwargs)
+        for k in kwargs:
+            queryset.check_pk_lookup(k.split('__')[0])
 
         count = 0
         found = []
@@ -252,6 +640,119 @@ class Queryset(object):
         else:
             return found[0]
 
+    async def in_bulk(self, id_list, field=None, batch_size=IN_BULK_SIZE):
+        '''
+        Retrieves the objects whose field value is in id_list, returns a
+        dictionary keyed by that value, missing values are not in the dict
+        '''
+        field_name = field or self.model.orm_pk
+        if not hasattr(self.model, field_name):
+            raise QuerysetError(
+                '{} wrong field name for model {}'.format(
+                    field_name,
+                    self.model.__name__
+                )
+            )
+        field = getattr(self.model, field_name)
+
+        if batch_size < 1:
+            raise QuerysetError('batch_size should be a positive integer')
+        self.check_pk_lookup(field_name)
+
+        id_list = list(set(id_list))
+        for v in id_list:
+            field.validate(v)
+
+        condition = '{t_n}.{k} = ANY ($1)'.format(
+            t_n=self.model.table_name or self.model.__name__.lower(),
+            k=field.db_column,
+        )
+        query = self.query_copy()
+        query[0]['ordering'] = None
+        query.append({'action': 'db__where', 'condition': condition})
+
+        results = {}
+        for i in range(0, len(id_list), batch_size):
+            batch = id_list[i:i + batch_size]
+            for rec in await self.fetch_records(deepcopy(query), batch):
+                instance = self.modelconstructor(rec)
+                results[getattr(instance, field_name)] = instance
+
+        return results
+
+    def keyset_fields(self, ordering):
+        fields = []
+        for f in ordering:
+            name = f.lstrip('-')
+            field = self.model.fields.get(name)
+            if field is None:
+                for model_field in self.model.fields.values():
+                    if model_field.db_column == name:
+                        field = model_field
+                        break
+                else:
+                    raise QuerysetError(
+                        '{} is not a correct field for {}'.format(
+                            name, self.model.__name__
+                        )
+                    )
+            fields.append(field)
+        return fields
+
+    async def paginate_keyset(self, page_size, cursor_token=None):
+        '''
+        Returns the page_size objects that come after the cursor_token
+        and the token to retrieve the next page (None in the last page)
+        '''
+        if page_size < 1:
+            raise QuerysetError('page_size should be a positive integer')
+
+        queryset = self.queryset()
+        # the offset would skip rows of every page
+        sliced = queryset.query[0].get('limit') is not None
+        if sliced or queryset.query[0].get('offset'):
+            raise QuerysetError(
+                'Keyset pagination can not be used on sliced querysets'
+            )
+        ordering = list(queryset.query[0]['ordering'] or [])
+        if not ordering:
+            raise QuerysetError(
+                'Keyset pagination needs the queryset to be ordered'
+            )
+
+        # the primary key makes the ordering unique, so no row is skipped
+        if self.model.db_pk not in [f.lstrip('-') for f in ordering]:
+            direction = ordering[-1].startswith('-') and '-' or ''
+            ordering.append(direction + self.model.db_pk)
+        queryset.query[0]['ordering'] = ordering
+
+        if cursor_token is not None:
+            token_ordering, values = decode_keyset_token(cursor_token)
+            if token_ordering != ordering:
+                raise QuerysetError(
+                    'The keyset pagination token belongs to other ordering'
+                )
+            queryset = queryset.after(values)
+
+        query = queryset.query_copy()
+        query[0]['limit'] = page_size + 1
+
+        results = [
+            queryset.modelconstructor(rec)
+            for rec in await queryset.fetch_records(query)
+        ]
+
+        if len(results) <= page_size:
+            return results, None
+
+        results = results[:page_size]
+        last_seen = results[-1]
+        values = [
+            getattr(last_seen, f.orm_field_name)
+            for f in self.keyset_fields(ordering)
+        ]
+        return results, encode_keyset_token(ordering, values)
+
     #               CHAINABLE QUERYSET METHODS
     def queryset(self):
         return self._copy_me()
@@ -323,9 +824,16 @@ class Queryset(object):
             lookup = None
             if len(k.split('__')) > 1:
                 k, lookup = k.split('__')
-                operator = LOOKUP_OPERATOR[lookup]
 
             field = getattr(self.model, k)
+            jsonb_lookup = (
+                isinstance(field, JsonbField) and
+                lookup in JSONB_LOOKUP_OPERATOR
+            )
+            if jsonb_lookup:
+                operator = JSONB_LOOKUP_OPERATOR[lookup]
+            elif lookup is not None:
+                operator = LOOKUP_OPERATOR[lookup]
 
             string_lookups = [
                 'exact', 'iexact',
@@ -338,7 +846,11 @@ class Queryset(object):
                 'k': field.db_column,
                 'v': v
             }
-            if operator == '({t_n}.{k}>={min} AND {t_n}.{k}<={max})':
+            if jsonb_lookup:
+                operator_formater['v'] = self.jsonb_lookup_value(
+                    field, lookup, v
+                )
+            elif operator == '({t_n}.{k}>={min} AND {t_n}.{k}<={max})':
                 if not isinstance(v, (tuple, list)):
                     raise QuerysetError(
                         '{} should be list or a tuple'.format(lookup)
@@ -376,12 +888,40 @@ class Queryset(object):
 
         return filters
 
+    @staticmethod
+    def jsonb_lookup_value(field, lookup, value):
+        '''
+        the sql value of the jsonb lookups: contains takes the json that
+        should be contained, has_key the key, and path a (keys, value)
+        pair, matched as containment so the index can be used
+        '''
+        if lookup == 'has_key':
+            if not isinstance(value, str):
+                raise QuerysetError('has_key should be a string')
+            return "'{}'".format(value.replace("'", "''"))
+
+        if lookup == 'path':
+            if not isinstance(value, (tuple, list)) or len(value) != 2:
+                raise QuerysetError(
+                    'path should be a (keys, value) list or tuple'
+                )
+            keys, value = value
+            if isinstance(keys, str):
+                keys = [keys]
+            for key in reversed(keys):
+                value = {key: value}
+        return field.sanitize_data(value)
+
     def filter(self, exclude=False, **kwargs):
         filters = self.calc_filters(kwargs, exclude)
         condition = ' AND '.join(filters)
 
         queryset = self.queryset()
 
+        # filtering by the shard key pins the queryset to one shard
+        if not exclude and self.model.shard_key in kwargs:
+            queryset.shard_value = kwargs[self.model.shard_key]
+
         queryset.query.append({'action': 'db__where', 'condition': condition})
         return queryset
 
@@ -405,9 +945,109 @@ class Queryset(object):
 
         return queryset
 
+    def using(self, db_alias):
+        '''
+        force the reads to the 'primary' database (read your own writes)
+        or to the 'replica' ones
+        '''
+        if db_alias not in ('primary', 'replica'):
+            raise QuerysetError(
+                '{} is not a database, use primary or replica'.format(
+                    db_alias
+                )
+            )
+        queryset = self.queryset()
+        queryset.db_alias = db_alias
+        return queryset
+
+    def timeout(self, seconds):
+        '''
+        the queries that take longer than those seconds are cancelled
+        and raise QueryTimeoutError
+        '''
+        if not isinstance(seconds, (int, float)) or seconds <= 0:
+            raise QuerysetError(
+                'The timeout should be a positive number of seconds'
+            )
+        queryset = self.queryset()
+        queryset.statement_timeout = seconds
+        return queryset
+
+    def values(self, *args, **kwargs):
+        '''
+        the rows are returned as dictionaries with only the fields
+        (or date functions, by keyword) requested
+        '''
+        values = []
+        for arg in args:
+            field = getattr(self.model, arg, None)
+            if not isinstance(field, Field) or isinstance(
+                    field, ManyToManyField):
+                raise QuerysetError(
+                    '{} is not a correct field for {}'.format(
+                        arg, self.model.__name__
+                    )
+                )
+            values.append({
+                'name': arg,
+                'sql': '{t_n}.{k}'.format(
+                    t_n=self.model.table_name or self.model.__name__.lower(),
+                    k=field.db_column,
+                ),
+            })
+
+        for name, function in kwargs.items():
+            if not isinstance(function, Trunc):
+                raise QuerysetError(
+                    '{} is not a correct function'.format(name)
+                )
+            values.append({'name': name, 'sql': function.as_sql(self.model)})
+
+        if not values:
+            raise QuerysetError('values needs at least one field')
+
+        queryset = self.queryset()
+        queryset.query[0]['values'] = values
+        return queryset
+
+    def annotate(self, **kwargs):
+        '''
+        aggregations calculated for each of the groups of rows that share
+        the same values
+        '''
+        queryset = self.queryset()
+        values = queryset.query[0].get('values')
+        if not values:
+            raise QuerysetError('annotate needs values to group by')
+
+        annotations = queryset.query[0].get('annotations', [])
+        names = [c['name'] for c in values + annotations]
+        for name, aggregation in kwargs.items():
+            if not isinstance(aggregation, Aggregate):
+                raise QuerysetError('{} is not an aggregation'.format(name))
+            if name in names:
+                raise QuerysetError('{} is already selected'.format(name))
+            annotations.append({
+                'name': name,
+                'sql': aggregation.as_sql(self.model),
+            })
+
+        # the model default ordering has no sense once grouped
+        queryset.query[0].update({
+            'annotations': annotations,
+            'ordering': None,
+        })
+        return queryset
+
     def order_by(self, *args):
         # retrieves from the database only the attrs requested
         # all the rest come as None
+        query = self.query_copy()
+        selected_names = [
+            c['name'] for c in
+            (query[0].get('values') or []) + query[0].get('annotations', [])
+        ]
+
         final_args = []
         for arg in args:
             if arg[0] == '-':
@@ -416,7 +1056,7 @@ class Queryset(object):
             else:
                 final_args.append(arg)
 
-            if not hasattr(self.model, arg):
+            if not hasattr(self.model, arg) and arg not in selected_names:
                 raise QuerysetError(
                     '{} is not a correct field for {}'.format(
                         arg, self.model.__name__
@@ -429,12 +1069,51 @@ class Queryset(object):
 
         return queryset
 
+    def after(self, last_seen):
+        '''
+        Keyset pagination, filters the rows that come after last_seen
+        (the object or its values for each of the ordering fields)
+        '''
+        queryset = self.queryset()
+        ordering = list(queryset.query[0]['ordering'] or [])
+        if not ordering:
+            raise QuerysetError(
+                'Keyset pagination needs the queryset to be ordered'
+            )
+        fields = self.keyset_fields(ordering)
+
+        if isinstance(last_seen, self.model):
+            values = [getattr(last_seen, f.orm_field_name) for f in fields]
+        elif isinstance(last_seen, (list, tuple)):
+            values = list(last_seen)
+        else:
+            values = [last_seen]
+
+        if len(values) != len(ordering):
+            raise QuerysetError(
+                '{} values needed to paginate ordering by {}'.format(
+                    len(ordering), ', '.join(ordering)
+                )
+            )
+
+        ordering = [
+            (o.startswith('-') and '-' or '') + f.db_column
+            for o, f in zip(ordering, fields)
+        ]
+        condition = self.db_manager.keyset_syntax(
+            ordering, [keyset_literal(v) for v in values]
+        )
+        queryset.query.append({'action': 'db__where', 'condition': condition})
+        return queryset
+
     async def latest_db_migration(self):
         kwargs = {
             'select': '*',
             'table_name': 'asyncorm_migrations',
             'join': '',
+            'group_by': '',
             'ordering': 'ORDER BY  -id',
+            'limit': '',
             'condition': "app = '{}'".format(self.model().app_name)
         }
 
@@ -451,7 +1130,7 @@ class Queryset(object):
                 return int(v)
 
     #               DB RELATED METHODS
-    async def db_request(self, db_request):
+    async def db_request(self, db_request, read=False, shard_value=None):
         db_request = deepcopy(db_request)
         db_request[0].update({
             'select': db_request[0].get('select', self.select),
@@ -459,10 +1138,24 @@ class Queryset(object):
                 'table_name', self.model.cls_tablename()
             ),
         })
-        query = self.db_manager.construct_query(db_request)
-        return await self.db_manager.request(query)
+        query, details = self.construct_query(db_request)
+
+        # without shard key value (tables creation and such) the request
+        # goes to every shard
+        responses = []
+        for db_manager in self.shard_managers(read, shard_value):
+            responses.append(
+                await db_manager.request(
+                    query, timeout=self.statement_timeout, **details
+                )
+            )
+        return responses[0]
 
     async def __getitem__(self, key):
+        query = self.query_copy()
+        offset = query[0].get('offset') or 0
+        limit = query[0].get('limit')
+
         if isinstance(key, slice):
             # control the keys values
             if key.start is not None and key.start < 0:
@@ -472,31 +1165,33 @@ class Queryset(object):
             if key.step is not None:
                 raise QuerysetError('Step on Queryset is not allowed')
 
-            # asign forward and stop to the modelmanager and return it
-            self.forward = key.start
-            self.stop = key.stop
-            if key.start is None:
-                self.forward = 0
-            return self
+            # the slice is relative to the previous one, if sliced already
+            start = key.start or 0
+            if key.stop is not None:
+                stop = key.stop
+                if limit is not None:
+                    stop = min(stop, limit)
+                limit = max(stop - start, 0)
+            elif limit is not None:
+                limit = max(limit - start, 0)
+
+            queryset = self.queryset()
+            queryset.query[0].update({
+                'offset': offset + start,
+                'limit': limit,
+            })
+            return queryset
 
         elif isinstance(key, int):
             # if its an int, the developer wants the object directly
             if key < 0:
                 raise QuerysetError('Negative indices are not allowed')
 
-            conn = await self.db_manager.get_conn()
-
-            cursor = self._cursor
-            if not cursor:
-                query = self.db_manager.construct_query(deepcopy(self.query))
-                cursor = Cursor(
-                    conn,
-                    query,
-                    forward=key,
-                )
+            if limit is None or key < limit:
+                query[0].update({'offset': offset + key, 'limit': 1})
 
-            async for res in cursor:
-                return self.modelconstructor(res)
+                for rec in await self.fetch_records(query):
+                    return self.modelconstructor(rec)
             raise IndexError(
                 'That {} index does not exist'.format(self.model.__name__)
             )
@@ -504,23 +1199,74 @@ class Queryset(object):
         else:
             raise TypeError("Invalid argument type.")
 
-    def __aiter__(self):
-        return self
+    async def chunks(self, size=500):
+        '''the instances of the queryset, in lists of up to size'''
+        query = self.query_copy()
+        managers = self.shard_managers(read=True)
+
+        if query[0].get('limit') is not None or len(managers) > 1:
+            records = await self.fetch_records(query)
+            for i in range(0, len(records), size):
+                yield [self.modelconstructor(r) for r in records[i:i + size]]
+            return
+
+        # the cursor keeps its connection in a transaction while the chunks
+        # are consumed, so it gets one of its own unless one is pinned
+        db_manager = managers[0]
+        transaction = current_transaction.get()
+        pinned = transaction is not None and transaction.atomic
+        if pinned:
+            conn = await db_manager.get_conn()
+        else:
+            conn = await db_manager.acquire()
 
-    async def __anext__(self):
-        if not self._cursor:
-            conn = await self.db_manager.get_conn()
-            query = self.db_manager.construct_query(self.query)
-            self._cursor = Cursor(
+        try:
+            query, details = self.construct_query(query)
+            cursor = Cursor(
                 conn,
                 query,
-                forward=self.forward,
-                stop=self.stop,
+                step=size,
+                timeout=self.statement_timeout or db_manager.timeout,
+                details=details,
+                manager=db_manager,
             )
+            async for records in cursor.chunks():
+                yield [self.modelconstructor(r) for r in records]
+        finally:
+            if not pinned:
+                await db_manager.release(conn)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._cursor is None:
+            query = self.query_copy()
+            managers = self.shard_managers(read=True)
+
+            if query[0].get('limit') is not None or len(managers) > 1:
+                # sliced querysets are retrieved in one go, no cursor needed,
+                # as are the ones merged from different shards
+                self._results = deque(await self.fetch_records(query))
+                self._cursor = False
+            else:
+                conn = await managers[0].get_conn()
+                query, details = self.construct_query(query)
+                self._cursor = Cursor(
+                    conn,
+                    query,
+                    timeout=(
+                        self.statement_timeout or managers[0].timeout
+                    ),
+                    details=details,
+                    manager=managers[0],
+                )
 
-        async for rec in self._cursor:
-            item = self.modelconstructor(rec)
-            return item
+        if self._cursor:
+            async for rec in self._cursor:
+                return self.modelconstructor(rec)
+        elif self._results:
+            return self.modelconstructor(self._results.popleft())
         raise StopAsyncIteration()
 
 
@@ -529,23 +1275,57 @@ class ModelManager(Queryset):
     def __init__(self, model, field=None):
         self.model = model
         self.field = field
+        self._loader = None
         super().__init__(model)
 
     def _copy_me(self):
         queryset = ModelManager(self.model)
         queryset.set_orm(self.orm)
         queryset.query = self.query_copy()
+        queryset.db_alias = self.db_alias
+        queryset.shard_value = self.shard_value
+        queryset.statement_timeout = self.statement_timeout
+        queryset.accessor = self.accessor
 
         return queryset
 
+    def loader(self, field=None):
+        '''
+        new loader that memoizes its results, meant to live as long as the
+        request that uses it does
+        '''
+        return ModelLoader(self, field=field)
+
+    def load(self, value):
+        '''
+        awaitable for the object with that primary key, all the loads
+        issued in the same loop iteration are resolved in one request
+        '''
+        if self._loader is None:
+            self._loader = ModelLoader(self, cache=False)
+        return self._loader.load(value)
+
     async def get_or_create(self, **kwargs):
         try:
             return await self.get(**kwargs), False
         except ModelDoesNotExist:
             return await self.create(**kwargs), True
 
+    def get_shard_value(self, instanced_model):
+        if not self.sharded:
+            return None
+
+        value = getattr(instanced_model, self.model.shard_key)
+        if value is None:
+            raise ModelError(
+                'The shard key {} can not be null'.format(self.model.shard_key)
+            )
+        return value
+
     async def save(self, instanced_model):
         # performs the database save
+        shard_value = self.get_shard_value(instanced_model)
+
         fields, field_data = [], []
         for k, data in instanced_model.data.items():
             f_class = getattr(instanced_model.__class__, k)
@@ -574,7 +1354,9 @@ class ModelManager(Queryset):
             )
         }]
         try:
-            response = await self.db_request(db_request)
+            response = await self.db_request(
+                db_request, shard_value=shard_value
+            )
         except UniqueViolationError:
             raise ModelError('The model violates a unique constraint')
 
@@ -607,9 +1389,9 @@ class ModelManager(Queryset):
                     db_request[0].update(
                         {'field_values': ', '.join([str(model_id), str(d)])}
                     )
-                    await self.db_request(db_request)
+                    await self.db_request(db_request, shard_value=shard_value)
             else:
-                await self.db_request(db_request)
+                await self.db_request(db_request, shard_value=shard_value)
 
     async def delete(self, instanced_model):
         db_request = [{
@@ -619,7 +1401,9 @@ class ModelManager(Queryset):
                 getattr(instanced_model, instanced_model.db_pk)
             )
         }]
-        return await self.db_request(db_request)
+        return await self.db_request(
+            db_request, shard_value=self.get_shard_value(instanced_model)
+        )
 
     async def create(self, **kwargs):
         n_object = self.model(**kwargs)
@@ -0,0 +1,40 @@
+__all__ = ['QueryPlan']
+
+
+class QueryPlan(object):
+    '''the parsed EXPLAIN (FORMAT JSON) output for a query'''
+
+    def __init__(self, explained):
+        self.explained = explained
+        self.plan = explained[0]['Plan']
+
+        self.startup_cost = self.plan['Startup Cost']
+        self.total_cost = self.plan['Total Cost']
+        self.estimated_rows = self.plan['Plan Rows']
+        # only known when the query was analyzed
+        self.rows = self.plan.get('Actual Rows')
+        self.actual_time = self.plan.get('Actual Total Time')
+        self.planning_time = explained[0].get('Planning Time')
+        self.execution_time = explained[0].get('Execution Time')
+        # only known when the buffers were requested
+        self.shared_hit_blocks = self.plan.get('Shared Hit Blocks')
+        self.shared_read_blocks = self.plan.get('Shared Read Blocks')
+
+        self.nodes = list(self.walk(self.plan))
+        self.seq_scans = [
+            n for n in self.nodes if n['Node Type'] == 'Seq Scan'
+        ]
+
+    def walk(self, node):
+        yield node
+        for child in node.get('Plans', []):
+            for n in self.walk(child):
+                yield n
+
+    def __repr__(self):
+        return '<QueryPlan {} cost={} rows={} seq_scans={}>'.format(
+            self.plan['Node Type'],
+            self.total_cost,
+            self.estimated_rows if self.rows is None else self.rows,
+            len(self.seq_scans),
+        )
@@ -1,13 +1,13 @@
 from .models import Model
 from .fields import (
     Field, PkField, BooleanField, CharField, EmailField, JsonField,
-    NumberField, IntegerField, DecimalField, DateField, DateTimeField,
-    ForeignKey, ManyToManyField, Uuid4Field, TimeField
+    JsonbField, NumberField, IntegerField, DecimalField, DateField,
+    DateTimeField, ForeignKey, ManyToManyField, Uuid4Field, TimeField
 )
 
 __all__ = (
     'Model', 'PkField', 'BooleanField', 'CharField', 'EmailField', 'JsonField',
-    'NumberField', 'IntegerField', 'DecimalField', 'DateField',
+    'JsonbField', 'NumberField', 'IntegerField', 'DecimalField', 'DateField',
     'DateTimeField', 'ForeignKey', 'ManyToManyField', 'Field', 'Uuid4Field',
     'TimeField'
 )
@@ -10,6 +10,9 @@ from ..exceptions import FieldError  # , ModuleError
 
 DATE_FIELDS = ['DateField', ]
 
+# the foreign key constraints of a creation string
+REFERENCES = re.compile(r'\s+references\s+\w+', re.I)
+
 KWARGS_TYPES = {
     'db_column': str,
     'uuid_type': str,
@@ -24,6 +27,7 @@ KWARGS_TYPES = {
     'strftime': str,
     'max_digits': int,
     'decimal_places': int,
+    'index': bool,
 }
 
 
@@ -318,6 +322,60 @@ class JsonField(Field):
         return '\'{}\''.format(value)
 
 
+class JsonbField(Field):
+    '''
+    json stored as postgres jsonb. The pool connections decode it, so
+    the values come back as python objects with no recompose needed.
+    index adds a GIN index, used by the contains, has_key and path
+    lookups. The models set json_encode to their database manager one
+    '''
+    internal_type = dict, list, str
+    creation_string = 'jsonb'
+    index_method = 'GIN'
+    json_encode = staticmethod(json.dumps)
+    args = ('db_column', 'default', 'null', 'unique', 'index')
+
+    def __init__(self, db_column='', default=None, null=False, unique=False,
+                 index=False):
+        super().__init__(
+            db_column=db_column, default=default, null=null, unique=unique,
+            index=index
+        )
+
+    def creation_query(self):
+        creation_string = '{} {}'.format(self.db_column, self.creation_string)
+        creation_string += self.null and ' NULL' or ' NOT NULL'
+
+        if self.default is not None:
+            default_value = self.default
+            if callable(self.default):
+                default_value = self.default()
+            creation_string += ' DEFAULT {}'.format(
+                self.sanitize_data(default_value)
+            )
+
+        if self.unique:
+            creation_string += ' UNIQUE'
+        return creation_string
+
+    def sanitize_data(self, value):
+        if value is None:
+            return 'NULL'
+        self.validate(value)
+
+        if isinstance(value, str):
+            try:
+                json.loads(value)
+            except JSONDecodeError:
+                raise FieldError(
+                    'The data entered can not be converted to json'
+                )
+        else:
+            value = self.json_encode(value)
+
+        return '\'{}\'::jsonb'.format(value.replace('\'', '\'\''))
+
+
 class NumberField(Field):
     pass
 
@@ -421,6 +479,13 @@ class ForeignKey(Field):
                          foreign_key=foreign_key, null=null, unique=unique
                          )
 
+    def creation_query(self, references=True):
+        # without references when the rows can live in other databases
+        creation_query = super().creation_query()
+        if not references:
+            creation_query = REFERENCES.sub('', creation_query)
+        return creation_query
+
     def sanitize_data(self, value):
         value = super().sanitize_data(value)
         return str(value)
@@ -441,8 +506,11 @@ class ManyToManyField(Field):
                          default=default, unique=unique
                          )
 
-    def creation_query(self):
-        return self.creation_string.format(**self.__dict__)
+    def creation_query(self, references=True):
+        creation_query = self.creation_string.format(**self.__dict__)
+        if not references:
+            creation_query = REFERENCES.sub('', creation_query)
+        return creation_query
 
     def validate(self, value):
         if isinstance(value, list):
@@ -1,7 +1,7 @@
 import inspect
 import os
 
-from .fields import Field, PkField, ManyToManyField, ForeignKey
+from .fields import Field, ForeignKey, JsonbField, ManyToManyField, PkField
 from ..manager import ModelManager
 from ..exceptions import ModelError, FieldError, ModelDoesNotExist
 from ..application import get_model
@@ -28,6 +28,7 @@ class ModelMeta(type):
         base_class.ordering = None
         base_class.unique_together = []
         base_class.table_name = ''
+        base_class.shard_key = None
         base_class.DoesNotExist = ModelDoesNotExist
         base_class.meta_items = ('ordering', 'unique_together', 'table_name')
 
@@ -42,11 +43,15 @@ class ModelMeta(type):
                 base_class.table_name = getattr(
                     defined_meta, 'table_name'
                 )
+            if hasattr(defined_meta, 'shard_key'):
+                base_class.shard_key = getattr(defined_meta, 'shard_key')
 
         base_class.fields = base_class.get_fields()
 
         if PkField not in [f.__class__ for f in base_class.fields.values()]:
             base_class.id = PkField()
+            base_class.id.orm_field_name = 'id'
+            base_class.id.table_name = base_class.cls_tablename()
             base_class.fields['id'] = base_class.id
 
             base_class.db_pk = 'id'
@@ -58,6 +63,14 @@ class ModelMeta(type):
             base_class.db_pk = pk_fields[0].db_column
             base_class.orm_pk = pk_fields[0].orm_field_name
 
+        if base_class.shard_key is not None:
+            if base_class.shard_key not in base_class.fields:
+                raise ModelError(
+                    'The shard_key {} is not a field of {}'.format(
+                        base_class.shard_key, base_class.__name__
+                    )
+                )
+
         for f in base_class.fields.values():
             if hasattr(f, 'choices'):
                 if f.choices:
@@ -126,9 +139,13 @@ class BaseModel(object, metaclass=ModelMeta):
         def fk_set(self):
             model = get_model(model_name)
 
-            return model.objects.filter(
+            queryset = model.objects.filter(
                 **{field_name: getattr(self, self.orm_pk)}
             )
+            queryset.accessor = '{}.{}_set'.format(
+                self.__class__.__name__, model_name.lower()
+            )
+            return queryset
 
         setattr(cls, '{}_set'.format(model_name.lower()), fk_set)
 
@@ -146,10 +163,12 @@ class BaseModel(object, metaclass=ModelMeta):
                 'm2m_tablename': table_name,
                 'other_tablename': other_column,
                 'otherdb_pk': other_model.db_pk,
+                'ordering': other_model.ordering,
                 'id_data': '{}={}'.format(
                     my_column, getattr(self, self.orm_pk)
                 ),
             }]
+            queryset.accessor = '{}.{}'.format(cls.__name__, method_name)
             return queryset
 
         method_name = (
@@ -161,6 +180,10 @@ class BaseModel(object, metaclass=ModelMeta):
     @classmethod
     def set_orm(cls, orm):
         cls.objects.set_orm(orm)
+        # the jsonb values are encoded with the json module configured
+        for field in cls.fields.values():
+            if isinstance(field, JsonbField):
+                field.json_encode = orm.db_manager.json_encode
 
     @property
     def data(self):
@@ -401,7 +424,12 @@ class Model(BaseModel):
 
                         setattr(self, attr_name, model().construct(data))
                 else:
-                    for join in subitems[0]['fields']:
+                    joins = [
+                        join for q in subitems
+                        if q['action'] == 'db__select_related'
+                        for join in q['fields']
+                    ]
+                    for join in joins:
                         if join['right_table'] == attr_name:
                             field = getattr(
                                 self.__class__,
@@ -428,6 +456,24 @@ class Model(BaseModel):
             )
         await self.objects.save(self)
 
+    async def load_related(self, field_name, loader=None):
+        # foreignkey object, concurrent loads are batched in one request
+        field = getattr(self.__class__, field_name, None)
+        if not isinstance(field, ForeignKey):
+            raise ModelError(
+                '{} is not a ForeignKey Field for {}.'.format(
+                    field_name, self.__class__.__name__
+                )
+            )
+
+        value = getattr(self, field_name)
+        if value is None or isinstance(value, BaseModel):
+            return value
+
+        if loader is None:
+            loader = get_model(field.foreign_key).objects
+        return await loader.load(value)
+
     async def delete(self):
         # object delete method
         self.deleted = True
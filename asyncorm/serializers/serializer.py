@@ -1,4 +1,31 @@
+import json
+import re
+
+from functools import partial
+from operator import attrgetter
+
 from ..exceptions import SerializerError
+from ..models.fields import (
+    DateField, DecimalField, Field, ForeignKey, JsonField, ManyToManyField
+)
+
+# the values json does not know (decimals, uuids) are sent as strings
+encoder = json.JSONEncoder(default=str)
+
+# the strftime directives and their equivalent in postgres to_char
+TO_CHAR = {
+    '%Y': 'YYYY',
+    '%y': 'YY',
+    '%m': 'MM',
+    '%d': 'DD',
+    '%j': 'DDD',
+    '%H': 'HH24',
+    '%I': 'HH12',
+    '%M': 'MI',
+    '%S': 'SS',
+    '%p': 'AM',
+    '%%': '%',
+}
 
 
 class Serializers():
@@ -29,8 +56,127 @@ class ModelSerializerMeta(type):
                     'The serializer has to define the fields\'s to serialize'
                 )
 
+        # compiled for the subclasses too, their getters can be overriden
+        if hasattr(base_class, '_fields'):
+            base_class._plan = cls.compile_plan(base_class)
+            base_class._columns = cls.compile_columns(base_class)
+
         return base_class
 
+    @staticmethod
+    def compile_plan(serializer):
+        '''
+        the (field name, getter) pairs that serialize an instance, so the
+        lookups are done once per serializer instead of once per row
+        '''
+        plan = []
+        for f in serializer._fields:
+            # if the serializer class has an specific serializer for that field
+            if hasattr(serializer, f):
+                method = getattr(serializer, f)
+                if isinstance(method, SerializerMethod):
+                    getter = getattr(serializer, 'get_{}'.format(f), None)
+                    if getter is None:
+                        # resolved on each call, so it fails as it always did
+                        getter = partial(
+                            serialize_method, serializer, 'get_{}'.format(f)
+                        )
+                    plan.append((f, partial(getter, method)))
+                elif is_nested(serializer, f):
+                    plan.append((f, partial(serialize_nested, method, f)))
+                continue
+
+            field = getattr(serializer.model, f, None)
+            if not isinstance(field, Field):
+                # not a field, resolved on each call as it always was
+                plan.append((f, partial(serialize_attribute, f)))
+            elif type(field).serialize_data is Field.serialize_data:
+                # the value is serialized as it is
+                plan.append((f, attrgetter(f)))
+            else:
+                plan.append((f, partial(serialize_field, field, f)))
+        return plan
+
+    @staticmethod
+    def compile_columns(serializer):
+        '''
+        the functions that serialize a whole column of instances, the
+        dates are formatted once per different value
+        '''
+        columns = []
+        for f, getter in serializer._plan:
+            field = getattr(serializer.model, f, None)
+            if isinstance(field, DateField) and not hasattr(serializer, f):
+                columns.append(partial(date_column, field, attrgetter(f)))
+            else:
+                columns.append(partial(column, getter))
+        return columns
+
+
+def is_nested(serializer, f):
+    '''the foreign keys with a serializer as attribute are nested objects'''
+    nested = getattr(serializer, f, None)
+    return (
+        isinstance(nested, type) and issubclass(nested, ModelSerializer) and
+        isinstance(getattr(serializer.model, f, None), ForeignKey)
+    )
+
+
+def to_char_pattern(strftime):
+    '''
+    the to_char pattern that formats the dates as strftime does, None when
+    some directive has no equivalent
+    '''
+    pattern = ''
+    for part in re.split('(%.)', strftime):
+        if part.startswith('%'):
+            if part not in TO_CHAR:
+                return None
+            pattern += TO_CHAR[part]
+        elif part:
+            # the literal text is quoted, so it is not read as a pattern
+            pattern += '"{}"'.format(part)
+    return pattern.replace("'", "''")
+
+
+def column(getter, instances):
+    return list(map(getter, instances))
+
+
+def date_column(field, getter, instances):
+    formatted = {}
+    values = []
+    for value in map(getter, instances):
+        if value not in formatted:
+            formatted[value] = field.serialize_data(value)
+        values.append(formatted[value])
+    return values
+
+
+def serialize_nested(serializer, name, instanced_model):
+    related = getattr(instanced_model, name)
+    if related is None:
+        return None
+    if not isinstance(related, serializer.model):
+        raise SerializerError(
+            '{} has to be select_related to be serialized nested'.format(name)
+        )
+    return serializer.serialize(related)
+
+
+def serialize_method(serializer, name, method, instanced_model):
+    return getattr(serializer, name)(method, instanced_model)
+
+
+def serialize_field(field, name, instanced_model):
+    return field.serialize_data(getattr(instanced_model, name))
+
+
+def serialize_attribute(name, instanced_model):
+    return getattr(instanced_model.__class__, name).serialize_data(
+        getattr(instanced_model, name)
+    )
+
 
 class SerializerMethod(Serializers):
     pass
@@ -52,27 +198,161 @@ class ModelSerializer(Serializers, metaclass=ModelSerializerMeta):
 
     @classmethod
     def serialize(cls, instanced_model):
-        return_dict = {}
-
         if not isinstance(instanced_model, cls.model):
             raise SerializerError(
                 'That model is not an instance of {}'.format(cls.model)
             )
 
-        for f in cls._fields:
-            # if the serializer class has an specific serializer for that field
-            if hasattr(cls, f):
-                serializer = getattr(cls, f)
-                if isinstance(serializer, SerializerMethod):
-                    serializer_method = getattr(cls, 'get_{}'.format(f))
-                    return_dict[f] = serializer_method(
-                        serializer, instanced_model
-                    )
-                # here we have to add subserializers when posible
-            else:
-                field_class = getattr(instanced_model.__class__, f)
-                return_dict[f] = field_class.serialize_data(
-                    getattr(instanced_model, f)
+        return {f: getter(instanced_model) for f, getter in cls._plan}
+
+    @classmethod
+    def serialize_many(cls, instances, buffer=None):
+        '''
+        serializes the instances column by column, instead of instance by
+        instance. Returns the list of dictionaries, or writes them to the
+        buffer as a json array when there is one
+        '''
+        instances = list(instances)
+        for instanced_model in instances:
+            if not isinstance(instanced_model, cls.model):
+                raise SerializerError(
+                    'That model is not an instance of {}'.format(cls.model)
                 )
 
-        return return_dict
+        names = [f for f, getter in cls._plan]
+        columns = [column(instances) for column in cls._columns]
+        serialized = [dict(zip(names, row)) for row in zip(*columns)]
+        if not columns:
+            serialized = [{} for _ in instances]
+
+        if buffer is None:
+            return serialized
+        buffer.write(encoder.encode(serialized))
+
+    @classmethod
+    async def serialize_queryset(cls, queryset, chunk_size=500, buffer=None):
+        '''
+        serializes the queryset pulling its rows in chunks of chunk_size.
+        Returns the list of dictionaries, or writes them to the buffer as a
+        json array, chunk by chunk, when there is one
+        '''
+        if buffer is not None:
+            async for chunk in cls.json_chunks(queryset, chunk_size):
+                buffer.write(chunk)
+            return
+
+        serialized = []
+        async for instances in cls.select_nested(queryset).chunks(chunk_size):
+            serialized.extend(cls.serialize_many(instances))
+        return serialized
+
+    @classmethod
+    def select_nested(cls, queryset):
+        '''the queryset with the related rows of the nested serializers'''
+        joined = [
+            join['orm_fieldname'] for q in queryset.query
+            if q['action'] == 'db__select_related' for join in q['fields']
+        ]
+        nested = [
+            f for f in cls._fields if is_nested(cls, f) and f not in joined
+        ]
+        return nested and queryset.select_related(*nested) or queryset
+
+    @classmethod
+    def json_object(cls, table_name):
+        '''
+        the json_build_object sql expression that serializes the rows of
+        table_name, as serialize does with the instances. None when some
+        date can only be formatted by python
+        '''
+        pairs = []
+        for f in cls._fields:
+            value = cls.json_value(f, table_name)
+            if value is None:
+                return None
+            pairs.append("'{}', {}".format(f, value))
+        return 'json_build_object({})'.format(', '.join(pairs))
+
+    @classmethod
+    def json_value(cls, f, table_name):
+        nested = getattr(cls, f, None)
+        field = getattr(cls.model, f, None)
+
+        if is_nested(cls, f):
+            right_table = nested.model.cls_tablename()
+            json_object = nested.json_object(right_table)
+            if json_object is None:
+                return None
+            return cls.model.objects.db_manager.db__select_json_related.format(
+                json_object=json_object,
+                right_table=right_table,
+                model_db_pk=nested.model.db_pk,
+                foreign_field='{}.{}'.format(table_name, field.db_column),
+            )
+
+        unsupported = (
+            nested is not None or not isinstance(field, Field) or
+            isinstance(field, ManyToManyField)
+        )
+        if unsupported:
+            raise SerializerError(
+                '{} can not be rendered by the database, only model fields '
+                'and foreign keys with a serializer can'.format(f)
+            )
+
+        value = '{}.{}'.format(table_name, field.db_column)
+        if isinstance(field, DateField):
+            pattern = to_char_pattern(field.strftime)
+            if pattern is None:
+                return None
+            return "to_char({}, '{}')".format(value, pattern)
+        if isinstance(field, DecimalField):
+            # as strings, the same way the encoder sends them
+            return '{}::text'.format(value)
+        if isinstance(field, JsonField):
+            return '{}::json'.format(value)
+        return value
+
+    @classmethod
+    async def render_json(cls, queryset):
+        '''
+        the queryset serialized as a json array in bytes, built by the
+        database with json_build_object and json_agg, so no instance is
+        constructed nor encoded. The fields have to be model fields, or
+        foreign keys with a nested serializer as attribute. The dates
+        to_char can not format (as the %s epoch) are serialized by python
+        '''
+        if queryset.model is not cls.model:
+            raise SerializerError(
+                'That queryset is not of {}'.format(cls.model)
+            )
+        json_object = cls.json_object(queryset.table_name)
+        if json_object is None:
+            serialized = await cls.serialize_queryset(queryset)
+            return encoder.encode(serialized).encode()
+        rendered = await queryset.select_json(json_object)
+        return rendered.encode()
+
+    @classmethod
+    async def json_chunks(cls, queryset, chunk_rows):
+        # the json array of the queryset, a piece per chunk of rows
+        yield '['
+        separator = ''
+        queryset = cls.select_nested(queryset)
+        async for instances in queryset.chunks(chunk_rows):
+            if instances:
+                # the chunks are separated by commas, as their rows are
+                rows = encoder.encode(cls.serialize_many(instances))
+                yield separator + rows[1:-1]
+                separator = ','
+        yield ']'
+
+    @classmethod
+    async def stream_json(cls, queryset, chunk_rows=500):
+        '''
+        async generator of the queryset serialized as a json array, in
+        bytes, chunk_rows rows at a time from a server side cursor, so the
+        memory used does not grow with the rows sent
+        '''
+        async for chunk in cls.json_chunks(queryset, chunk_rows):
+            yield chunk.encode()
@@ -0,0 +1,7 @@
+'''
+Performance benchmarks for asyncorm, run them with:
+
+    python -m benchmarks --output results.json
+
+The results are written as JSON so they can be compared across commits
+'''
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from asyncorm.application import configure_orm
+from asyncorm.application.configure import parse_config
+
+from .runner import measure, report, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument(
+        '--output', help='file where the JSON results are written'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='rounds of each benchmark'
+    )
+    parser.add_argument(
+        '--filter', default='', help='only the benchmarks with that in name'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # the micro benchmarks need the models, not the database
+    config = parse_config(os.path.join(ROOT, 'tests', 'asyncorm.ini'))
+    config['manager'] = 'FakeManager'
+    configure_orm(config)
+    from .micro import BENCHMARKS
+
+    results = []
+    for name, setup, number, items in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        results.append(
+            measure(name, setup(), number, repeat=args.repeat, items=items)
+        )
+    report(results)
+
+    if args.output:
+        save_results(results, args.output, 'micro')
+
+
+if __name__ == '__main__':
+    main()
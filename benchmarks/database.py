@@ -0,0 +1,234 @@
+'''
+End to end benchmarks against the local postgres of tests/asyncorm.ini,
+run them with:
+
+    python -m benchmarks.database --rows 1000 --concurrency 1 8 32
+
+The tests/testapp tables are dropped and loaded again with the rows
+requested, so never point it to a database with data to keep
+'''
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import random
+import time
+
+from contextvars import ContextVar
+
+from asyncorm.application import configure_orm, get_model
+from asyncorm.database import instrumentation
+from asyncorm.database.transactions import Transaction
+from asyncorm.serializers import ModelSerializer
+
+from .runner import save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the same tables tests/__main__.py drops
+TABLES = [
+    'Publisher', 'Author', 'library', 'Organization', 'Developer', 'Client',
+    'Developer_Organization', 'Author_Publisher', 'Appointment', 'Reader',
+    'Inventory', 'Shipment',
+]
+
+PAGE_SIZE = 50
+SCAN_PAGES = 5
+INSERT_SIZE = 10
+
+# queries run by the request in progress, counted by instrumentation
+request_queries = ContextVar('request_queries', default=None)
+
+
+def count_query(event):
+    queries = request_queries.get()
+    if queries is not None:
+        queries.append(event.operation)
+
+
+def percentile(values, percent):
+    # nearest rank, values have to be sorted
+    index = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+async def load(orm_app, rows):
+    for table_name in TABLES:
+        query = orm_app.db_manager.construct_query(
+            [{'action': 'db__drop_table', 'table_name': table_name}]
+        )
+        await orm_app.db_manager.request(query)
+    await orm_app.create_db()
+
+    Author = get_model('Author')
+    Book = get_model('Book')
+    authors = []
+    for x in range(10):
+        author = Author(name='author {}'.format(x), age=30)
+        await author.save()
+        authors.append(author.na)
+
+    for x in range(rows):
+        book = Book(
+            name='book {}'.format(x),
+            content='hard cover',
+            author=random.choice(authors),
+        )
+        await book.save()
+
+
+def scenarios(rows):
+    Book = get_model('Book')
+
+    class BookSerializer(ModelSerializer):
+
+        class Meta:
+            model = Book
+            fields = ['id', 'name', 'content', 'date_created', 'price']
+
+    async def get():
+        await Book.objects.get(id=random.randint(1, rows))
+
+    async def filtered_list():
+        start = random.randint(1, max(rows - PAGE_SIZE, 1))
+        queryset = Book.objects.filter(id__gte=start, content='hard cover')
+        async for book in await queryset[:PAGE_SIZE]:
+            pass
+
+    async def serialized_list():
+        start = random.randint(1, max(rows - PAGE_SIZE, 1))
+        queryset = Book.objects.filter(
+            id__gte=start, id__lt=start + PAGE_SIZE
+        )
+        await BookSerializer.serialize_queryset(
+            queryset, chunk_size=PAGE_SIZE, buffer=io.StringIO()
+        )
+
+    async def rendered_list():
+        # the same json, built by the database
+        start = random.randint(1, max(rows - PAGE_SIZE, 1))
+        queryset = Book.objects.filter(
+            id__gte=start, id__lt=start + PAGE_SIZE
+        )
+        await BookSerializer.render_json(queryset)
+
+    async def paginated_scan():
+        token = None
+        for _ in range(SCAN_PAGES):
+            books, token = await Book.objects.paginate_keyset(
+                PAGE_SIZE, token
+            )
+            if token is None:
+                break
+
+    # the books names are unique together with their content
+    inserted = itertools.count()
+
+    async def transactional_insert():
+        async with Transaction():
+            for _ in range(INSERT_SIZE):
+                book = Book(
+                    name='inserted {}'.format(next(inserted)),
+                    content='paperback',
+                )
+                await book.save()
+
+    async def update():
+        book = await Book.objects.get(id=random.randint(1, rows))
+        book.quantity += 1
+        await book.save()
+
+    return [
+        get, filtered_list, serialized_list, rendered_list, paginated_scan,
+        transactional_insert, update,
+    ]
+
+
+async def run(scenario, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    queries = []
+
+    async def request():
+        async with semaphore:
+            request_queries.set([])
+            start = time.perf_counter()
+            # each request on a connection of its own, as a server would
+            async with Transaction(atomic=False):
+                await scenario()
+            latencies.append(time.perf_counter() - start)
+            queries.append(len(request_queries.get()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'name': scenario.__name__,
+        'concurrency': concurrency,
+        'requests': requests,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': sum(latencies) / len(latencies),
+        'requests_per_second': requests / elapsed,
+        'queries_per_request': sum(queries) / len(queries),
+    }
+
+
+def report(results):
+    for r in results:
+        print(
+            '{name:16} c={concurrency:<4} p50={p50:.6f}s p95={p95:.6f}s '
+            'p99={p99:.6f}s {requests_per_second:10.1f} req/s '
+            '{queries_per_request:6.1f} queries/req'.format(**r)
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.database')
+    parser.add_argument(
+        '--rows', type=int, default=1000, help='books loaded in the table'
+    )
+    parser.add_argument(
+        '--requests', type=int, default=200, help='requests by scenario'
+    )
+    parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 8, 32],
+        help='concurrent requests levels'
+    )
+    parser.add_argument(
+        '--output', help='file where the JSON results are written'
+    )
+    parser.add_argument(
+        '--filter', default='', help='only the scenarios with that in name'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    orm_app = configure_orm(os.path.join(ROOT, 'tests', 'asyncorm.ini'))
+    loop = orm_app.loop
+
+    loop.run_until_complete(load(orm_app, args.rows))
+    instrumentation.add_hooks(after=count_query)
+
+    results = []
+    for scenario in scenarios(args.rows):
+        if args.filter not in scenario.__name__:
+            continue
+        for concurrency in args.concurrency:
+            results.append(loop.run_until_complete(
+                run(scenario, args.requests, concurrency)
+            ))
+    report(results)
+
+    if args.output:
+        save_results(results, args.output, 'database')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+'''
+Micro benchmarks of the hot paths that do not need the database: query
+building, queryset chaining, model hydration, serialization and the
+fields data conversion. Each benchmark is a setup function that returns
+the callable to time
+'''
+import asyncio
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from asyncorm.application import get_model
+from asyncorm.database import generate_records
+from asyncorm.models import fields
+
+__all__ = ['BENCHMARKS']
+
+ROWS = 10000
+
+# (name, setup, number of calls per round, items processed per call)
+BENCHMARKS = []
+
+
+def benchmark(number=1000, items=1, name=None):
+    def register(setup):
+        BENCHMARKS.append((name or setup.__name__, setup, number, items))
+        return setup
+    return register
+
+
+def construct(queryset):
+    # construct_query consumes the chain, so each call gets a copy
+    db_manager = queryset.db_manager
+    chain = queryset.query_copy()
+
+    def construct_query():
+        return db_manager.construct_query([dict(q) for q in chain])
+    return construct_query
+
+
+def book_records(n):
+    return [{
+        'id': i,
+        'name': 'book name {}'.format(i),
+        'content': 'hard cover',
+        # a book a day, for the year before
+        'date_created': date(2017, 1, 1) - timedelta(days=i % 365),
+        'author': 1,
+        'price': Decimal('25'),
+        'quantity': 1,
+    } for i in range(n)]
+
+
+@benchmark(number=5000)
+def construct_query_all():
+    return construct(get_model('Book').objects.all())
+
+
+@benchmark(number=5000)
+def construct_query_filter():
+    return construct(
+        get_model('Book').objects.filter(
+            name__startswith='book', id__lt=100
+        ).exclude(content='paperback').order_by('-name')
+    )
+
+
+@benchmark(number=5000)
+def construct_query_select_related():
+    return construct(
+        get_model('Book').objects.select_related('author').filter(id__lt=10)
+    )
+
+
+@benchmark(number=2000)
+def queryset_chaining():
+    Book = get_model('Book')
+
+    def chain():
+        return Book.objects.filter(id__lt=100).exclude(
+            name='book name 3'
+        ).order_by('-name').using('replica')
+    return chain
+
+
+@benchmark(number=1, items=ROWS, name='modelconstructor_{}_rows'.format(ROWS))
+def modelconstructor():
+    queryset = get_model('Book').objects.all()
+    records = book_records(ROWS)
+
+    def hydrate():
+        return [queryset.modelconstructor(r) for r in records]
+    return hydrate
+
+
+@benchmark(number=1, items=ROWS, name='model_construct_{}_rows'.format(ROWS))
+def model_construct():
+    Book = get_model('Book')
+    records = book_records(ROWS)
+
+    def hydrate():
+        for r in records:
+            Book().construct(r)
+    return hydrate
+
+
+@benchmark(number=1, items=ROWS, name='queryset_fetch_{}_rows'.format(ROWS))
+def queryset_fetch():
+    # the orm is configured with the in memory FakeManager
+    Book = get_model('Book')
+    db_manager = Book.objects.db_manager
+    db_manager.tables.pop(Book.cls_tablename(), None)
+    db_manager.add_records(Book, generate_records(Book, ROWS))
+    loop = asyncio.get_event_loop()
+
+    async def fetch():
+        books = []
+        async for book in await Book.objects.all()[0:ROWS]:
+            books.append(book)
+        return books
+
+    return lambda: loop.run_until_complete(fetch())
+
+
+@benchmark(number=5000)
+def model_init():
+    Book = get_model('Book')
+
+    def init():
+        return Book(name='book name', content='hard cover')
+    return init
+
+
+@benchmark(number=1, items=ROWS, name='serialize_{}_rows'.format(ROWS))
+def serialize():
+    from tests.testapp.serializer import BookSerializer2
+
+    Book = get_model('Book')
+    books = [Book().construct(r) for r in book_records(ROWS)]
+    serializer = BookSerializer2()
+
+    def serialize_books():
+        return [serializer.serialize(b) for b in books]
+    return serialize_books
+
+
+@benchmark(number=1, items=ROWS, name='serialize_many_{}_rows'.format(ROWS))
+def serialize_many():
+    from tests.testapp.serializer import BookSerializer2
+
+    Book = get_model('Book')
+    books = [Book().construct(r) for r in book_records(ROWS)]
+
+    return lambda: BookSerializer2.serialize_many(books)
+
+
+def book_date_serializer():
+    from asyncorm.serializers import ModelSerializer
+
+    class BookDateSerializer(ModelSerializer):
+
+        class Meta:
+            model = get_model('Book')
+            fields = ['name', 'content', 'date_created']
+
+    return BookDateSerializer
+
+
+@benchmark(number=1, items=ROWS, name='serialize_dates_{}_rows'.format(ROWS))
+def serialize_dates():
+    Book = get_model('Book')
+    books = [Book().construct(r) for r in book_records(ROWS)]
+    serializer = book_date_serializer()
+
+    def serialize_books():
+        return [serializer.serialize(b) for b in books]
+    return serialize_books
+
+
+@benchmark(
+    number=1, items=ROWS, name='serialize_many_dates_{}_rows'.format(ROWS)
+)
+def serialize_many_dates():
+    Book = get_model('Book')
+    books = [Book().construct(r) for r in book_records(ROWS)]
+    serializer = book_date_serializer()
+
+    return lambda: serializer.serialize_many(books)
+
+
+FIELD_VALUES = (
+    (fields.CharField(max_length=50), 'some text'),
+    (fields.EmailField(max_length=50), 'someone@example.com'),
+    (fields.IntegerField(), 42),
+    (fields.DecimalField(), Decimal('2.5')),
+    (fields.BooleanField(), True),
+    (fields.DateField(), date(2017, 1, 1)),
+    (fields.JsonField(max_length=100), {'some': 'json'}),
+    (fields.JsonbField(), {'some': 'json'}),
+)
+
+
+def field_benchmarks():
+    for field, value in FIELD_VALUES:
+        field_type = field.__class__.__name__
+
+        def sanitize(field=field, value=value):
+            return lambda: field.sanitize_data(value)
+
+        def validate(field=field, value=value):
+            return lambda: field.validate(value)
+
+        benchmark(
+            number=20000, name='sanitize_data_{}'.format(field_type)
+        )(sanitize)
+        benchmark(
+            number=20000, name='validate_{}'.format(field_type)
+        )(validate)
+
+
+field_benchmarks()
@@ -0,0 +1,60 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import timeit
+
+__all__ = ['measure', 'report', 'save_results']
+
+
+def measure(name, func, number, repeat=5, items=1):
+    '''
+    times repeat rounds of number calls to func, items is the amount of
+    units (rows, instances) each call processes.
+    The best round is the stable figure, the median shows the noise
+    '''
+    func()
+    rounds = [
+        r / number for r in timeit.repeat(func, number=number, repeat=repeat)
+    ]
+    best = min(rounds)
+    return {
+        'name': name,
+        'number': number,
+        'repeat': repeat,
+        'items': items,
+        'best': best,
+        'median': statistics.median(rounds),
+        'items_per_second': best and items / best or None,
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results):
+    for r in results:
+        print('{name:45} {best:12.9f}s {median:12.9f}s {ips:14.1f}/s'.format(
+            ips=r['items_per_second'] or 0, **r
+        ))
+
+
+def save_results(results, output, suite):
+    with open(output, 'w') as f:
+        json.dump({
+            'suite': suite,
+            'commit': commit(),
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=2)
@@ -1,6 +1,6 @@
 from sanic import Sanic
 from sanic.exceptions import NotFound, URLBuildError
-from sanic.response import json
+from sanic.response import json, stream
 from sanic.views import HTTPMethodView
 
 from asyncorm import configure_orm
@@ -76,6 +76,17 @@ class BooksView(HTTPMethodView):
                      })
 
 
+class BooksExportView(HTTPMethodView):
+
+    async def get(self, request):
+        # all the books, streamed as they come from the database
+        async def streaming_fn(response):
+            async for chunk in BookSerializer.stream_json(Book.objects.all()):
+                response.write(chunk)
+
+        return stream(streaming_fn, content_type='application/json')
+
+
 class BookView(HTTPMethodView):
     async def get_object(self, request, book_id):
         try:
@@ -129,6 +140,7 @@ class BookView(HTTPMethodView):
 
 
 app.add_route(BooksView.as_view(), '/books/')
+app.add_route(BooksExportView.as_view(), '/books/export/')
 app.add_route(BookView.as_view(), '/books/<book_id:int>/')
 
 if __name__ == '__main__':
@@ -37,9 +37,10 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
     ],
+    # contextvars and the async generators need python 3.7
+    python_requires='>=3.7',
     test_suite='tests',
     tests_require=test_requirements,
     entry_points={
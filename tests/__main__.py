@@ -13,7 +13,8 @@ loop = orm_app.loop
 
 drop_tables = [
     'Publisher', 'Author', 'library', 'Organization', 'Developer', 'Client',
-    'Developer_Organization', 'Author_Publisher', 'Appointment', 'Reader'
+    'Developer_Organization', 'Author_Publisher', 'Appointment', 'Reader',
+    'Inventory', 'Shipment',
 ]
 
 
@@ -3,7 +3,7 @@ from uuid import UUID
 
 from asyncorm.exceptions import FieldError
 from asyncorm import models
-from .testapp.models import Book, Publisher, Reader
+from .testapp.models import Book, Inventory, Publisher, Reader
 from .testapp2.models import Organization, Appointment
 from .test_helper import AioTestCase
 
@@ -160,6 +160,36 @@ class FieldTests(AioTestCase):
         self.assertEqual(publisher.json['last_name'], 'Gregory')
         self.assertEqual(publisher.json['67'], 6)
 
+    async def test_jsonbfield_saving_dictionary(self):
+        inventory = Inventory(
+            name='shelf', specs={'color': 'red', 'sizes': [1, 2]}
+        )
+
+        await inventory.save()
+
+        inventory = await Inventory.objects.get(id=inventory.id)
+        self.assertEqual(inventory.specs, {'color': 'red', 'sizes': [1, 2]})
+
+    async def test_jsonbfield_saving_wrong_string(self):
+        inventory = Inventory(name='shelf', specs='{"color": red}')
+
+        with self.assertRaises(FieldError) as exc:
+            await inventory.save()
+
+        self.assertEqual(
+            exc.exception.args[0],
+            'The data entered can not be converted to json'
+        )
+
+    def test_jsonbfield_sanitize_data(self):
+        field = models.JsonbField()
+
+        self.assertEqual(
+            field.sanitize_data({'name': "o'hara"}),
+            '\'{"name": "o\'\'hara"}\'::jsonb'
+        )
+        self.assertEqual(field.sanitize_data(None), 'NULL')
+
     async def test_booleanfield_validate(self):
         models.BooleanField(default=False).validate(True)
 
@@ -1,11 +1,18 @@
+import asyncio
+
 from datetime import datetime
 from datetime import timedelta
 
+from asyncorm.application import orm_app
 from asyncorm.exceptions import (
-    ModelError, ModelDoesNotExist, QuerysetError, MultipleObjectsReturned
+    ModelError, ModelDoesNotExist, QuerysetError, MultipleObjectsReturned,
+    QueryTimeoutError,
 )
 
-from .testapp.models import Author, Book
+from asyncorm.manager import Count, Max, Sum, Trunc
+from asyncorm.manager.managers import COUNT_CACHE_SIZE, Queryset
+
+from .testapp.models import Author, Book, Inventory
 from .testapp2.models import Appointment, Developer, Client
 from .test_helper import AioTestCase
 
@@ -89,6 +96,35 @@ class ManageTestMethods(AioTestCase):
 
         self.assertTrue(await queryset.count() == 100)
 
+    async def test_count_estimate(self):
+        estimate = await Book.objects.count(estimate=True)
+        filtered_estimate = await Book.objects.filter(
+            id__lte=100).count(estimate=True)
+
+        self.assertTrue(isinstance(estimate, int))
+        self.assertTrue(isinstance(filtered_estimate, int))
+
+    async def test_count_cached(self):
+        queryset = Book.objects.filter(name__startswith='cached count')
+
+        count = await queryset.count(cache_ttl=60)
+        await Book.objects.create(
+            **{'name': 'cached count book', 'content': 'hard cover'}
+        )
+
+        self.assertEqual(await queryset.count(cache_ttl=60), count)
+        self.assertEqual(await queryset.count(), count + 1)
+
+    def test_count_cache_bounded(self):
+        Queryset.cache_count('expired count', -1, 3)
+        for x in range(COUNT_CACHE_SIZE + 10):
+            Queryset.cache_count('count {}'.format(x), 60, x)
+
+        self.assertEqual(len(Queryset.count_cache), COUNT_CACHE_SIZE)
+        self.assertFalse('expired count' in Queryset.count_cache)
+        self.assertFalse('count 0' in Queryset.count_cache)
+        self.assertEqual(Queryset.cached_count('count 10'), 10)
+
     async def test_filter_changed_fieldname(self):
         author = await Author.objects.filter(na__lt=5)[0]
 
@@ -129,7 +165,7 @@ class ManageTestMethods(AioTestCase):
 
         book = await queryset[0]
 
-        self.assertFalse(book.id == 24 - 5)
+        self.assertEqual(book.id, 24 - 5)
 
     async def test_slice_wrong_slice(self):
         with self.assertRaises(QuerysetError) as exc:
@@ -163,6 +199,62 @@ class ManageTestMethods(AioTestCase):
             'Negative indices are not allowed' == exc.exception.args[0]
         )
 
+    async def test_after(self):
+        queryset = Book.objects.filter(id__lt=10).order_by('id').after(5)
+
+        book = await queryset[0]
+
+        self.assertEqual(book.id, 6)
+        self.assertEqual(await queryset.count(), 4)
+
+    async def test_after_instance(self):
+        last_seen = await Book.objects.get(id=5)
+
+        book = await Book.objects.all().after(last_seen)[0]
+
+        self.assertEqual(book.id, 4)
+
+    async def test_after_wrong_values(self):
+        with self.assertRaises(QuerysetError) as exc:
+            Book.objects.order_by('name', 'id').after(5)
+
+        self.assertEqual(
+            '2 values needed to paginate ordering by name, id',
+            exc.exception.args[0]
+        )
+
+    async def test_paginate_keyset(self):
+        queryset = Book.objects.filter(id__range=(1, 5))
+
+        page, token = await queryset.paginate_keyset(2)
+        self.assertEqual([b.id for b in page], [5, 4])
+
+        page, token = await queryset.paginate_keyset(2, token)
+        self.assertEqual([b.id for b in page], [3, 2])
+
+        page, token = await queryset.paginate_keyset(2, token)
+        self.assertEqual([b.id for b in page], [1])
+        self.assertTrue(token is None)
+
+    async def test_paginate_keyset_sliced(self):
+        queryset = await Book.objects.filter(id__range=(1, 5))[1:]
+        with self.assertRaises(QuerysetError) as exc:
+            await queryset.paginate_keyset(2)
+
+        self.assertEqual(
+            'Keyset pagination can not be used on sliced querysets',
+            exc.exception.args[0]
+        )
+
+    async def test_paginate_keyset_wrong_token(self):
+        with self.assertRaises(QuerysetError) as exc:
+            await Book.objects.paginate_keyset(2, 'wrong token')
+
+        self.assertEqual(
+            'Not a valid keyset pagination token',
+            exc.exception.args[0]
+        )
+
     async def test_filter(self):
         queryset = Book.objects.filter(id__lte=30)
 
@@ -240,6 +332,40 @@ class ManageTestMethods(AioTestCase):
 
         self.assertEqual(await queryset.count(), 0)
 
+    async def test_jsonb_lookups(self):
+        await Inventory.objects.create(**{
+            'name': 'jsonb lookups',
+            'specs': {'color': 'blue', 'size': {'width': 30, 'height': 40}},
+        })
+        queryset = Inventory.objects.filter(name='jsonb lookups')
+
+        self.assertEqual(
+            await queryset.filter(specs__contains={'color': 'blue'}).count(), 1
+        )
+        self.assertEqual(
+            await queryset.filter(specs__contains={'color': 'red'}).count(), 0
+        )
+        self.assertEqual(
+            await queryset.filter(specs__has_key='size').count(), 1
+        )
+        self.assertEqual(
+            await queryset.filter(specs__has_key='weight').count(), 0
+        )
+        self.assertEqual(
+            await queryset.filter(
+                specs__path=(['size', 'width'], 30)
+            ).count(),
+            1
+        )
+
+    async def test_jsonb_lookups_wrong_value(self):
+        with self.assertRaises(QuerysetError) as exc:
+            Inventory.objects.filter(specs__path=('size', ))
+        self.assertEqual(
+            'path should be a (keys, value) list or tuple',
+            exc.exception.args[0]
+        )
+
     async def test_string_lookups_wrong_fieldtype(self):
         with self.assertRaises(QuerysetError)as exc:
             Book.objects.filter(id__exact=3)
@@ -376,6 +502,73 @@ class ManageTestMethods(AioTestCase):
         count = await Book.objects.filter(id=2800).count()
         self.assertEqual(count, 0)
 
+    async def test_in_bulk(self):
+        books = await Book.objects.in_bulk([1, 2, 3, 2800], batch_size=2)
+
+        self.assertEqual(sorted(books.keys()), [1, 2, 3])
+        self.assertTrue(isinstance(books[2], Book))
+        self.assertEqual(books[2].id, 2)
+
+    async def test_in_bulk_by_field(self):
+        books = await Book.objects.filter(id__lt=20).in_bulk(
+            ['book name 10', 'book name 150'], field='name'
+        )
+
+        self.assertEqual(list(books.keys()), ['book name 10'])
+
+    async def test_in_bulk_empty(self):
+        books = await Book.objects.in_bulk([])
+
+        self.assertEqual(books, {})
+
+    async def test_in_bulk_wrong_field(self):
+        with self.assertRaises(QuerysetError) as exc:
+            await Book.objects.in_bulk([1, 2], field='toto')
+
+        self.assertEqual(
+            'toto wrong field name for model Book',
+            exc.exception.args[0]
+        )
+
+    async def test_load_coalesced(self):
+        authors = await asyncio.gather(
+            Author.objects.load(1),
+            Author.objects.load(2),
+            Author.objects.load(1),
+        )
+
+        self.assertEqual([a.na for a in authors], [1, 2, 1])
+
+    async def test_load_does_not_exist(self):
+        with self.assertRaises(ModelDoesNotExist) as exc:
+            await Author.objects.load(2800)
+
+        self.assertTrue('does not exist' in exc.exception.args[0])
+
+    async def test_loader_memoizes(self):
+        loader = Author.objects.loader()
+
+        author = await loader.load(1)
+        authors = await loader.load_many([1, 2])
+
+        self.assertTrue(author is authors[0])
+        self.assertEqual(authors[1].na, 2)
+
+    async def test_load_related(self):
+        author = await Author.objects.create(
+            **{'name': 'loaded author', 'age': 23}
+        )
+        book = await Book.objects.create(**{
+            'name': 'book with loaded author',
+            'content': 'hard cover',
+            'author': author.na,
+        })
+
+        loaded = await book.load_related('author')
+
+        self.assertTrue(isinstance(loaded, Author))
+        self.assertEqual(loaded.na, author.na)
+
     async def test_create(self):
         create_dict = {'name': 'Juanito', 'age': 73}
 
@@ -423,6 +616,140 @@ class ManageTestMethods(AioTestCase):
 
         self.assertEqual(total_price, quant * 25)
 
+    async def test_aggregate(self):
+        q_books = Book.objects.filter(id__lt=100)
+
+        quant = await q_books.count()
+        result = await q_books.aggregate(
+            total_price=Sum('price'),
+            maxPrice=Max('price'),
+            n=Count('*'),
+        )
+
+        self.assertEqual(result, {
+            'total_price': quant * 25,
+            'maxPrice': 25,
+            'n': quant,
+        })
+
+    async def test_gather(self):
+        books, count, result = await orm_app.gather(
+            Book.objects.filter(id__lte=3),
+            Book.objects.filter(id__lt=100).count(),
+            Book.objects.filter(id__lt=100).aggregate(n=Count('*')),
+            concurrency=2,
+        )
+
+        self.assertEqual([b.id for b in books], [3, 2, 1])
+        self.assertEqual(count, 99)
+        self.assertEqual(result, {'n': 99})
+
+    async def test_timeout(self):
+        books = Book.objects.filter(id__lt=100).timeout(5)
+
+        self.assertEqual(await books.count(), 99)
+        self.assertEqual((await books[0]).id, 99)
+
+    async def test_timeout_exceeded(self):
+        with self.assertRaises(QueryTimeoutError):
+            await orm_app.db_manager.request(
+                'SELECT pg_sleep(1);', timeout=0.1
+            )
+        with self.assertRaises(QueryTimeoutError):
+            await orm_app.db_manager.fetch('SELECT pg_sleep(1);', timeout=0.1)
+
+    async def test_timeout_not_positive(self):
+        with self.assertRaises(QuerysetError) as exc:
+            Book.objects.timeout(0)
+
+        self.assertEqual(
+            'The timeout should be a positive number of seconds',
+            exc.exception.args[0]
+        )
+
+    async def test_explain(self):
+        plan = await Book.objects.filter(id__lt=100).explain(analyze=True)
+
+        self.assertTrue(plan.total_cost > 0)
+        self.assertEqual(plan.rows, 99)
+        self.assertTrue(plan.actual_time is not None)
+
+    async def test_explain_text(self):
+        plan = await Book.objects.filter(id__lt=100).explain(format='text')
+
+        self.assertTrue('library' in plan)
+
+    async def test_explain_wrong_format(self):
+        with self.assertRaises(QuerysetError) as exc:
+            await Book.objects.explain(format='xml')
+
+        self.assertEqual(
+            'xml is not a correct format, choose from: json, text',
+            exc.exception.args[0]
+        )
+
+    async def test_aggregate_not_numeric(self):
+        with self.assertRaises(QuerysetError) as exc:
+            await Book.objects.aggregate(max_name=Max('name'))
+
+        self.assertEqual('name is not a numeric field', exc.exception.args[0])
+
+    async def test_values(self):
+        book = await Book.objects.filter(id__lt=5).values('id', 'name')[0]
+
+        self.assertEqual(book, {'id': 4, 'name': 'book name 3'})
+
+    async def test_values_annotate(self):
+        author = await Author.objects.create(
+            **{'name': 'grouped author', 'age': 23}
+        )
+        for x in range(3):
+            await Book.objects.create(**{
+                'name': 'grouped book {}'.format(x),
+                'content': 'hard cover',
+                'author': author.na,
+                'price': 10,
+            })
+
+        q_books = Book.objects.filter(author=author.na).values(
+            'author',
+            month=Trunc('date_created', 'month'),
+        ).annotate(total=Sum('price'), n=Count('id')).order_by('-total')
+
+        rows = []
+        async for row in q_books:
+            rows.append(row)
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['author'], author.na)
+        self.assertEqual(rows[0]['total'], 30)
+        self.assertEqual(rows[0]['n'], 3)
+
+        # the groups are counted, not the rows grouped
+        self.assertEqual(await q_books.count(), 1)
+        self.assertEqual(await q_books.count(cache_ttl=10), 1)
+        with self.assertRaises(QuerysetError) as exc:
+            await q_books.aggregate(total=Sum('price'))
+        self.assertEqual(
+            'Can not aggregate the annotated groups', exc.exception.args[0]
+        )
+
+        # the annotations names are quoted, as they are selected
+        q_books = Book.objects.values('author').annotate(
+            maxPrice=Max('price')
+        ).order_by('-maxPrice')
+        prices = [row['maxPrice'] async for row in q_books]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    async def test_annotate_without_values(self):
+        with self.assertRaises(QuerysetError) as exc:
+            Book.objects.annotate(total=Sum('price'))
+
+        self.assertEqual(
+            'annotate needs values to group by',
+            exc.exception.args[0]
+        )
+
     async def test_max(self):
         await Book.objects.create(
             **{'name': 'chancleta 2',
@@ -469,6 +796,12 @@ class ManageTestMethods(AioTestCase):
 
         self.assertFalse(resp)
 
+    async def test_exists_sliced(self):
+        queryset = Book.objects.filter(id__lt=5).select_related('author')
+
+        self.assertTrue(await (await queryset[3:]).exists())
+        self.assertFalse(await (await queryset[4:]).exists())
+
     def test_select_related_wrong_field(self):
         field_name = 'toto__noto'
         with self.assertRaises(QuerysetError) as exc:
@@ -1,5 +1,13 @@
-from asyncorm.application import get_model
-from asyncorm.exceptions import FieldError, ModelError, SerializerError
+import io
+import json
+
+from datetime import datetime
+
+from asyncorm.application import get_model, orm_app
+from asyncorm.database import NPlusOneDetector
+from asyncorm.exceptions import (
+    FieldError, ModelError, NPlusOneError, SerializerError,
+)
 from asyncorm.serializers import ModelSerializer, SerializerMethod
 
 from .testapp.models import Book, Author
@@ -134,6 +142,48 @@ class ModelTests(AioTestCase):
         # and is correct comming back for the other model
         self.assertTrue(client_set.id == dev.id)
 
+    async def test_transaction(self):
+        async with orm_app.transaction():
+            dev = Developer(name='transactional', age=31)
+            await dev.save()
+            try:
+                # the savepoint is rolled back, the transaction goes on
+                async with orm_app.transaction():
+                    client = Client(name='rolled back', dev=dev.id)
+                    await client.save()
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.assertTrue(await Developer.objects.filter(id=dev.id).exists())
+        self.assertFalse(
+            await Client.objects.filter(name='rolled back').exists()
+        )
+
+    async def test_transaction_rollback(self):
+        with self.assertRaises(ValueError):
+            async with orm_app.transaction():
+                dev = Developer(name='never saved', age=31)
+                await dev.save()
+                raise ValueError()
+
+        self.assertFalse(await Developer.objects.filter(id=dev.id).exists())
+
+    async def test_n_plus_one_detected(self):
+        with self.assertRaises(NPlusOneError) as exc:
+            with NPlusOneDetector(threshold=2, raise_error=True):
+                async for author in Author.objects.all():
+                    await author.book_set().count()
+
+        self.assertTrue('Author.book_set' in exc.exception.args[0])
+
+    async def test_n_plus_one_under_threshold(self):
+        with NPlusOneDetector(threshold=5, raise_error=True) as detector:
+            async for author in Author.objects.filter(na__lte=3):
+                await author.book_set().count()
+
+        self.assertEqual(detector.reported, [])
+
     async def test_m2m_inverse_relation_exists(self):
         # the inverse relation is correctly set (not instantiated model)
         self.assertTrue(hasattr(Organization, 'developer_set'))
@@ -160,6 +210,14 @@ class ModelTests(AioTestCase):
         self.assertEqual(developer_set.id, dev.id)
         self.assertTrue(organization_set.id in org_list)
 
+        # sliced and indexed by the database
+        orgs_returned = dev.organization_set().order_by('id')
+        self.assertEqual((await orgs_returned[3]).id, sorted(org_list)[3])
+        self.assertEqual(
+            [o.id async for o in await orgs_returned[2:4]],
+            sorted(org_list)[2:4],
+        )
+
     async def test_serialize_wrong_argument(self):
         # the inverse relation is correctly set
         q_book = Book.objects.filter(id__lt=100)
@@ -192,6 +250,151 @@ class ModelTests(AioTestCase):
 
         self.assertEqual(serialized_book.get('name'), 'book name 98')
 
+    async def test_serialize_date(self):
+        class BookDateSerializer(ModelSerializer):
+            class Meta:
+                model = Book
+                fields = ['id', 'date_created']
+
+        book = await Book.objects.get(id=3)
+        serialized_book = BookDateSerializer.serialize(book)
+
+        self.assertEqual(list(serialized_book.keys()), ['id', 'date_created'])
+        self.assertEqual(
+            serialized_book['date_created'],
+            Book.date_created.serialize_data(book.date_created)
+        )
+
+    async def test_serialize_many(self):
+        books = []
+        async for book in Book.objects.filter(id__lt=10):
+            books.append(book)
+
+        self.assertEqual(
+            BookSerializer2.serialize_many(books),
+            [BookSerializer2.serialize(book) for book in books]
+        )
+
+    async def test_serialize_queryset(self):
+        q_books = Book.objects.filter(id__lt=100)
+        serialized = await BookSerializer2.serialize_queryset(
+            q_books, chunk_size=10
+        )
+
+        self.assertEqual(len(serialized), 99)
+        self.assertEqual(serialized[1]['name'], 'book name 97')
+
+        buffer = io.StringIO()
+        await BookSerializer2.serialize_queryset(
+            q_books, chunk_size=10, buffer=buffer
+        )
+        self.assertEqual(json.loads(buffer.getvalue()), serialized)
+
+    async def test_stream_json(self):
+        q_books = Book.objects.filter(id__lt=100)
+        chunks = []
+        async for chunk in BookSerializer2.stream_json(q_books, chunk_rows=10):
+            chunks.append(chunk)
+
+        self.assertEqual(chunks[0], b'[')
+        self.assertEqual(chunks[-1], b']')
+        self.assertEqual(
+            json.loads(b''.join(chunks).decode()),
+            await BookSerializer2.serialize_queryset(q_books),
+        )
+
+    async def test_render_json(self):
+        q_books = Book.objects.filter(id__lt=100)
+        rendered = await BookSerializer2.render_json(q_books)
+
+        self.assertTrue(isinstance(rendered, bytes))
+        self.assertEqual(
+            json.loads(rendered.decode()),
+            await BookSerializer2.serialize_queryset(q_books),
+        )
+
+    async def test_render_json_nested(self):
+        class AuthorSerializer(ModelSerializer):
+
+            class Meta:
+                model = Author
+                fields = ['na', 'name']
+
+        class BookAuthorSerializer(ModelSerializer):
+            author = AuthorSerializer
+
+            class Meta:
+                model = Book
+                fields = ['name', 'price', 'author']
+
+        author = await Author.objects.create(
+            **{'name': 'rendered author', 'age': 41}
+        )
+        book = await Book.objects.create(**{
+            'name': 'rendered book',
+            'content': 'paperback',
+            'author': author.na,
+        })
+        rendered = await BookAuthorSerializer.render_json(
+            Book.objects.filter(id=book.id)
+        )
+
+        self.assertEqual(json.loads(rendered.decode()), [{
+            'name': 'rendered book',
+            'price': '25.00',
+            'author': {'na': author.na, 'name': 'rendered author'},
+        }])
+
+        # python serializes the same rows the same way
+        q_books = Book.objects.filter(id__lt=book.id + 1)
+        rendered = await BookAuthorSerializer.render_json(q_books)
+        self.assertEqual(
+            json.loads(rendered.decode()),
+            await BookAuthorSerializer.serialize_queryset(q_books),
+        )
+        book = await Book.objects.select_related('author').get(id=book.id)
+        self.assertEqual(
+            BookAuthorSerializer.serialize(book)['author'],
+            {'na': author.na, 'name': 'rendered author'},
+        )
+
+        with self.assertRaises(SerializerError) as exc:
+            BookAuthorSerializer.serialize(await Book.objects.get(id=book.id))
+        self.assertEqual(
+            exc.exception.args[0],
+            'author has to be select_related to be serialized nested'
+        )
+
+    async def test_render_json_epoch(self):
+        class OrganizationSerializer(ModelSerializer):
+
+            class Meta:
+                model = Organization
+                fields = ['name', 'date']
+
+        await Organization.objects.create(
+            name='rendered organization', date=datetime(2017, 1, 1, 10, 30)
+        )
+        q_organizations = Organization.objects.filter(
+            name='rendered organization'
+        )
+        # to_char has no %s epoch, so the dates are formatted by python
+        self.assertEqual(OrganizationSerializer.json_object('x'), None)
+        rendered = await OrganizationSerializer.render_json(q_organizations)
+        self.assertEqual(
+            json.loads(rendered.decode()),
+            await OrganizationSerializer.serialize_queryset(q_organizations),
+        )
+
+    async def test_render_json_not_renderable(self):
+        with self.assertRaises(SerializerError) as exc:
+            await BookSerializer.render_json(Book.objects.all())
+        self.assertTrue(
+            exc.exception.args[0].startswith(
+                'kks can not be rendered by the database'
+            )
+        )
+
     async def test_wrong_serializer_no_model(self):
         # complains if we have a model serializer without model
         with self.assertRaises(SerializerError) as exc:
@@ -253,3 +456,26 @@ class ModelTests(AioTestCase):
 
         book_ser = BookSerializerNew().serialize(await Book.objects.get(id=3))
         self.assertEqual(book_ser['its_a_2'], 2)
+
+    async def test_serializer_subclass_overrides_methodfield(self):
+        class BookSerializerNew(ModelSerializer):
+            its_a_2 = SerializerMethod()
+
+            def get_its_a_2(self, instance):
+                return instance.its_a_2()
+
+            class Meta:
+                model = Book
+                fields = ['its_a_2', ]
+
+        class BookSerializerChild(BookSerializerNew):
+
+            def get_its_a_2(self, instance):
+                return instance.its_a_2() * 10
+
+        book = await Book.objects.get(id=3)
+        self.assertEqual(BookSerializerNew().serialize(book)['its_a_2'], 2)
+        self.assertEqual(BookSerializerChild().serialize(book)['its_a_2'], 20)
+        self.assertEqual(
+            BookSerializerChild.serialize_many([book]), [{'its_a_2': 20}]
+        )
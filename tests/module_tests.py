@@ -1,9 +1,29 @@
+import asyncio
+import json
+
+from types import SimpleNamespace
+
+from asyncpg.exceptions import QueryCanceledError
+
 from asyncorm.application import get_model, orm_app, configure_orm
-from asyncorm.exceptions import ModelError, ModuleError
+from asyncorm.database import (
+    Cursor, FakeManager, NPlusOneDetector, PostgresManager, SlowQueryLog,
+    generate_records, instrumentation,
+)
+from asyncorm.database.fake import Record
+from asyncorm.database.instrumentation import fingerprint
+from asyncorm.database.nplusone import record_in_scope
+from asyncorm.database.transactions import Transaction
+from asyncorm.exceptions import (
+    ConfigError, ModelError, ModuleError, QuerysetError, QueryTimeoutError,
+)
+from asyncorm.manager import Avg, Max, Sum
 
 from .test_helper import AioTestCase
 
 Book = get_model('Book')
+Inventory = get_model('Inventory')
+Shipment = get_model('Shipment')
 
 db_config = {
     'database': 'asyncorm',
@@ -75,3 +95,313 @@ class ModuleTests(AioTestCase):
         })
         # every model declared has the same db_manager
         self.assertTrue(orm_app.db_manager is Book.objects.db_manager)
+
+    def test_replicas_round_robin(self):
+        db_manager = PostgresManager(dict(
+            db_config,
+            replicas=[{'database': 'asyncorm'}, {'database': 'asyncorm'}],
+        ))
+        first = db_manager.route(read=True)
+        second = db_manager.route(read=True)
+
+        self.assertEqual(len(db_manager.replicas), 2)
+        self.assertTrue(first is not second)
+        self.assertTrue(first is db_manager.route(read=True))
+        self.assertEqual(first.conn_data['user'], db_config['user'])
+
+    def test_replicas_writes_go_to_primary(self):
+        db_manager = PostgresManager(dict(
+            db_config, replicas=['postgres://localhost/asyncorm'],
+        ))
+
+        self.assertTrue(db_manager.route() is db_manager)
+        self.assertTrue(
+            db_manager.route(read=True, using='primary') is db_manager
+        )
+        self.assertTrue(db_manager.route(read=True) is not db_manager)
+
+    def test_replicas_wrong_router(self):
+        with self.assertRaises(ConfigError) as exc:
+            PostgresManager(dict(db_config, router='random'))
+
+        self.assertEqual(
+            'random is not a known router', exc.exception.args[0]
+        )
+
+    async def test_using_primary(self):
+        count = await Book.objects.using('primary').filter(id__lte=3).count()
+
+        self.assertEqual(count, 3)
+
+    def test_shards_routing(self):
+        db_manager = PostgresManager(dict(
+            db_config, shards=[{'database': 'asyncorm'}],
+        ))
+
+        self.assertEqual(len(db_manager.shards), 2)
+        self.assertTrue(db_manager.shards[0] is db_manager)
+        self.assertTrue(db_manager.shard_for(3) is db_manager.shards[1])
+        self.assertTrue(db_manager.shard_for(4) is db_manager)
+        self.assertTrue(
+            db_manager.shard_for('acme') is db_manager.shard_for('acme')
+        )
+
+    async def test_json_module_encodes_jsonb(self):
+        dumped = []
+
+        def dumps(value):
+            dumped.append(value)
+            return json.dumps(value).encode()
+
+        db_manager = orm_app.db_manager
+        orm_app.db_manager = FakeManager(dict(
+            db_config, json_module=SimpleNamespace(
+                dumps=dumps, loads=json.loads
+            ),
+        ))
+        Inventory.set_orm(orm_app)
+        try:
+            await Inventory.objects.create(name='shelf', specs={'size': 2})
+            self.assertEqual(dumped, [{'size': 2}])
+            self.assertTrue(any(
+                '\'{"size": 2}\'::jsonb' in query
+                for query, args in orm_app.db_manager.queries
+            ))
+        finally:
+            orm_app.db_manager = db_manager
+            Inventory.set_orm(orm_app)
+
+    async def test_shards_merge(self):
+        # two in memory shards, the customers 3 and 5 go to the second
+        db_manager = orm_app.db_manager
+        orm_app.db_manager = FakeManager(dict(
+            db_config, shards=[{'database': 'asyncorm'}],
+        ))
+        Shipment.set_orm(orm_app)
+        first, second = orm_app.db_manager.shards
+        try:
+            for customer, weight in [(3, 5), (4, 2), (5, 9), (6, 7)]:
+                await Shipment.objects.create(customer=customer, weight=weight)
+            self.assertEqual(len(first.tables['Shipment']), 2)
+            self.assertEqual(len(second.tables['Shipment']), 2)
+
+            # merged in the model ordering, and then sliced
+            shipments = [s async for s in Shipment.objects.all()]
+            self.assertEqual([s.weight for s in shipments], [2, 5, 7, 9])
+            sliced = [s async for s in await Shipment.objects.all()[1:3]]
+            self.assertEqual([s.weight for s in sliced], [5, 7])
+            self.assertEqual(await Shipment.objects.count(), 4)
+
+            # the shard key pins the queryset to its shard
+            queries = len(first.queries)
+            [s async for s in Shipment.objects.filter(customer=3)]
+            self.assertEqual(len(first.queries), queries)
+
+            # each shard numbers its primary keys
+            with self.assertRaises(QuerysetError):
+                await Shipment.objects.get(id=1)
+            with self.assertRaises(QuerysetError):
+                await Shipment.objects.in_bulk([1, 2])
+
+            with self.assertRaises(QuerysetError):
+                await Shipment.objects.aggregate(mean=Avg('weight'))
+            first.responder = lambda q, a: [Record(total=7, top=5)]
+            second.responder = lambda q, a: [Record(total=14, top=9)]
+            self.assertEqual(
+                await Shipment.objects.aggregate(
+                    total=Sum('weight'), top=Max('weight')
+                ),
+                {'total': 21, 'top': 9},
+            )
+            first.responder = second.responder = None
+
+            shipment = [
+                s async for s in Shipment.objects.all() if s.customer == 5
+            ][0]
+            await shipment.delete()
+            self.assertEqual(len(first.tables['Shipment']), 2)
+            self.assertEqual(len(second.tables['Shipment']), 1)
+
+            # the referenced authors are not in every shard
+            self.assertEqual(
+                Shipment.objects.add_fk_field_builder(Shipment.author)[0][
+                    'field_creation_string'
+                ],
+                'author integer NULL',
+            )
+        finally:
+            orm_app.db_manager = db_manager
+            Shipment.set_orm(orm_app)
+
+    def test_query_fingerprint(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM library WHERE ( library.id = ANY (array[1,2]) "
+                "AND library.name LIKE 'it''s' )  LIMIT 10;"
+            ),
+            'SELECT * FROM library WHERE ( library.id = ANY (array[?]) '
+            'AND library.name LIKE ? ) LIMIT ?;'
+        )
+
+    async def test_instrumentation_hooks(self):
+        events = []
+        instrumentation.add_hooks(after=events.append)
+        instrumentation.collect_stats = True
+        try:
+            await Book.objects.filter(id__lte=3).count()
+        finally:
+            instrumentation.remove_hooks(after=events.append)
+            instrumentation.collect_stats = False
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].model, 'Book')
+        self.assertEqual(events[0].operation, 'count')
+        self.assertEqual(events[0].rows, 1)
+        self.assertTrue(events[0].execution_time > 0)
+        self.assertTrue(instrumentation.stats[events[0].shape].count >= 1)
+
+    async def test_slow_query_log(self):
+        slow_queries = SlowQueryLog(0, size=1)
+        slow_queries.install(instrumentation)
+        try:
+            await Book.objects.filter(name='slow book').count()
+            await Book.objects.filter(name='slow book').exists()
+        finally:
+            slow_queries.uninstall(instrumentation)
+
+        self.assertEqual(len(slow_queries.queries), 1)
+        slow_query = slow_queries.queries[0]
+        self.assertEqual(slow_query['operation'], 'exists')
+        self.assertFalse('slow book' in slow_query['query'])
+        self.assertTrue('module_tests.py' in slow_query['caller'])
+
+    async def test_slow_query_plan(self):
+        db_manager = FakeManager(db_config)
+        db_manager.responder = lambda q, a: [
+            Record(plan='[{"Plan": {"Node Type": "Result"}}]')
+        ]
+        slow_queries = SlowQueryLog(0, explain=1)
+        slow_queries.install(instrumentation)
+        try:
+            await db_manager.fetch('SELECT 1;')
+            # the log holds the task capturing the plan until it is done
+            tasks = list(slow_queries._tasks)
+            self.assertEqual(len(tasks), 1)
+            await asyncio.gather(*tasks)
+            await asyncio.sleep(0)
+        finally:
+            slow_queries.uninstall(instrumentation)
+
+        self.assertEqual(slow_queries._tasks, set())
+        self.assertEqual(
+            slow_queries.queries[0]['plan'],
+            [{'Plan': {'Node Type': 'Result'}}],
+        )
+
+    async def test_transaction_commit_failure(self):
+        # when a commit fails the rest of the transactions are rolled back
+        first, second = FakeManager(db_config), FakeManager(db_config)
+
+        async def failed_commit():
+            raise ModelError('commit failed')
+
+        with self.assertRaises(ModelError):
+            async with Transaction() as transaction:
+                await transaction.get_conn(first)
+                await transaction.get_conn(second)
+                transaction.transactions[-1].commit = failed_commit
+
+        self.assertEqual(first.queries, [('BEGIN', ()), ('ROLLBACK', ())])
+        self.assertEqual(second.queries, [('BEGIN', ())])
+
+    async def test_n_plus_one_query_error(self):
+        # the error of the query is not masked by the N+1 one
+        db_manager = FakeManager(db_config)
+
+        def fail(query, args):
+            raise ModelError('query failed')
+        db_manager.responder = fail
+
+        with self.assertRaises(ModelError):
+            with NPlusOneDetector(threshold=0, raise_error=True) as detector:
+                await db_manager.fetch('SELECT * FROM library;')
+
+        self.assertEqual(len(detector.reported), 1)
+        self.assertFalse(record_in_scope in instrumentation.after_hooks)
+
+    async def test_query_canceled(self):
+        # only the cancellations by the statement timeout are timeouts
+        db_manager = FakeManager(db_config)
+
+        def canceled(message):
+            def respond(query, args):
+                raise QueryCanceledError(message)
+            return respond
+
+        db_manager.responder = canceled(
+            'canceling statement due to user request'
+        )
+        with self.assertRaises(QueryCanceledError) as exc:
+            await db_manager.fetch('SELECT 1;')
+        self.assertFalse(isinstance(exc.exception, QueryTimeoutError))
+
+        db_manager.responder = canceled(
+            'canceling statement due to statement timeout'
+        )
+        with self.assertRaises(QueryTimeoutError):
+            await db_manager.fetch('SELECT 1;')
+
+    async def test_benchmark_scenarios(self):
+        from benchmarks.database import run, scenarios
+
+        # each database benchmark scenario runs once, in memory
+        db_manager = orm_app.db_manager
+        orm_app.db_manager = FakeManager(db_config)
+        orm_app.db_manager.add_records(Book, generate_records(Book, 100))
+        Book.set_orm(orm_app)
+        try:
+            for scenario in scenarios(100):
+                result = await run(scenario, 1, 1)
+                self.assertEqual(result['requests'], 1)
+        finally:
+            orm_app.db_manager = db_manager
+            Book.set_orm(orm_app)
+
+    async def test_cursor_busy(self):
+        # the cursor reads count in the least busy routing too
+        db_manager = FakeManager(db_config)
+        busy = []
+
+        def responder(query, args):
+            busy.append(db_manager.busy)
+            return [Record(id=1)]
+
+        db_manager.responder = responder
+        conn = await db_manager.acquire()
+        try:
+            cursor = Cursor(conn, 'SELECT 1;', manager=db_manager)
+            self.assertEqual([r['id'] async for r in cursor], [1])
+        finally:
+            await db_manager.release(conn)
+
+        self.assertEqual(max(busy), 1)
+        self.assertEqual(db_manager.busy, 0)
+
+    async def test_fake_manager(self):
+        db_manager = FakeManager(db_config)
+        db_manager.add_records(Book, generate_records(Book, 5))
+
+        record = await db_manager.request(
+            'SELECT * FROM library WHERE ( library.id = 3 );'
+        )
+        self.assertEqual(record['id'], 3)
+        self.assertEqual(
+            len(await db_manager.fetch('SELECT * FROM library LIMIT 2;')), 2
+        )
+
+        record = await db_manager.request(
+            "INSERT INTO library (name, content) VALUES ('new, book', "
+            "'paperback') RETURNING *;"
+        )
+        self.assertEqual(record['id'], 6)
+        self.assertEqual(record['name'], 'new, book')
@@ -60,3 +60,18 @@ class Reader(models.Model):
     size = models.CharField(choices=SIZE_CHOICES, max_length=2)
     power = models.CharField(choices=POWER_CHOICES, max_length=2, null=True)
     weight = models.IntegerField(default=weight)
+
+
+class Inventory(models.Model):
+    name = models.CharField(max_length=50)
+    specs = models.JsonbField(null=True, index=True)
+
+
+class Shipment(models.Model):
+    customer = models.IntegerField()
+    weight = models.IntegerField(default=1)
+    author = models.ForeignKey(foreign_key='Author', null=True)
+
+    class Meta():
+        ordering = ['weight', ]
+        shard_key = 'customer'